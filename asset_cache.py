@@ -0,0 +1,265 @@
+import subprocess
+import contextlib
+import threading
+import hashlib
+import shutil
+import json
+import time
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, the cache is then only shared safely between the threads of one worker process
+    fcntl = None
+
+
+_HASH_CHUNK_SIZE = 8 * 1024 * 1024
+_ASSET_PREFIX = '@@ASSET '
+
+# prints every file the .blend links to by a relative path (textures, libraries, caches), resolved to an absolute
+# path, files linked by an absolute path are read from their original location
+_LIST_ASSETS_SCRIPT = ("import bpy; "
+                       "[print('" + _ASSET_PREFIX + "' + bpy.path.abspath(p)) for p in bpy.utils.blend_paths() "
+                       "if p.startswith('//')]")
+
+_cache_lock = threading.Lock()
+
+# the project each thread renders from, held with a shared lock so no other worker evicts its files
+_project_locks = threading.local()
+
+
+def get_cache_path(cfg, *parts):
+    return os.path.join(os.path.abspath(cfg['cache']['path']), *parts)
+
+
+def load_index(cfg):
+    try:
+        with open(get_cache_path(cfg, 'index.json'), 'r', encoding='utf8') as f:
+            index = json.load(f)
+    except (IOError, ValueError):
+        index = {'sources': {}, 'blobs': {}, 'views': {}}
+
+    # the asset lists of older versions left out the assets outside the folder of the .blend
+    index.pop('assets', None)
+    index.setdefault('relative_assets', {})
+
+    return index
+
+
+@contextlib.contextmanager
+def lock_index(cfg):
+    # the thread lock orders the slots of a worker, the file lock the worker processes sharing the cache
+    with _cache_lock:
+        os.makedirs(get_cache_path(cfg), exist_ok=True)
+
+        with open(get_cache_path(cfg, 'index.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            yield
+
+
+def get_project_lock_path(cfg, project_name):
+    return get_cache_path(cfg, 'locks', project_name + '.lock')
+
+
+def hold_project(cfg, project_name):
+    # the lock is kept until the thread moves on to another project, a persistent Blender keeps reading the files
+    # between the batches
+    if fcntl is None or getattr(_project_locks, 'name', None) == project_name:
+        return
+
+    os.makedirs(get_cache_path(cfg, 'locks'), exist_ok=True)
+    lock_file = open(get_project_lock_path(cfg, project_name), 'a')
+    fcntl.flock(lock_file, fcntl.LOCK_SH)
+
+    if getattr(_project_locks, 'file', None) is not None:
+        _project_locks.file.close()
+
+    _project_locks.file = lock_file
+    _project_locks.name = project_name
+
+
+def is_project_in_use(cfg, project_name):
+    if fcntl is None or not os.path.exists(get_project_lock_path(cfg, project_name)):
+        return False
+
+    with open(get_project_lock_path(cfg, project_name), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+
+    return False
+
+
+def get_view_project(cfg, view_path):
+    return os.path.relpath(view_path, get_cache_path(cfg, 'views')).split(os.sep)[0]
+
+
+def save_index(cfg, index):
+    # written to a temporary file first, so a crash never leaves a broken index behind
+    path = get_cache_path(cfg, 'index.json')
+    with open(path + '.tmp', 'w', encoding='utf8') as f:
+        json.dump(index, f)
+
+    os.replace(path + '.tmp', path)
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def get_blob_path(cfg, content_hash):
+    return get_cache_path(cfg, 'blobs', content_hash[:2], content_hash)
+
+
+def cache_file(cfg, index, source):
+    # revalidation is a stat first, the file is only hashed again when its size or mtime changed
+    source = os.path.abspath(source)
+    stat = os.stat(source)
+    entry = index['sources'].get(source)
+
+    if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+        content_hash = hash_file(source)
+        index['sources'][source] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': content_hash}
+    else:
+        content_hash = entry['hash']
+
+    blob = get_blob_path(cfg, content_hash)
+    if not os.path.exists(blob):
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        shutil.copyfile(source, blob + '.tmp')
+        os.replace(blob + '.tmp', blob)
+
+        logging.info('Cached "{}" ({:0.1f} MB).'.format(source, stat.st_size / 1024 / 1024))
+
+    index['blobs'][content_hash] = {'size': stat.st_size, 'last_used': time.time()}
+
+    return content_hash
+
+
+def link_view(cfg, index, view_path, content_hash):
+    if index['views'].get(view_path) == content_hash and os.path.exists(view_path):
+        return
+
+    os.makedirs(os.path.dirname(view_path), exist_ok=True)
+    if os.path.exists(view_path):
+        os.remove(view_path)
+
+    # hard links keep a single copy on disk, a copy is the fallback for file systems without them
+    try:
+        os.link(get_blob_path(cfg, content_hash), view_path)
+    except OSError:
+        shutil.copyfile(get_blob_path(cfg, content_hash), view_path)
+
+    index['views'][view_path] = content_hash
+
+
+def list_linked_assets(cfg, source):
+    try:
+        output = subprocess.run([cfg['general']['blender_path'], '-b', source, '--python-expr', _LIST_ASSETS_SCRIPT],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
+                                errors='replace').stdout
+    except Exception as e:
+        logging.warning('The linked assets of "{}" could not be listed: {}'.format(source, e))
+        return []
+
+    return [line[len(_ASSET_PREFIX):].strip() for line in output.splitlines() if line.startswith(_ASSET_PREFIX)]
+
+
+def get_relative_assets(cfg, index, source, content_hash):
+    # the paths relative to the folder of the .blend, Blender resolves them relative to the cached copy
+    if content_hash not in index['relative_assets']:
+        base = os.path.dirname(os.path.abspath(source))
+        assets = []
+
+        for asset in list_linked_assets(cfg, source):
+            asset = os.path.abspath(asset)
+            try:
+                if os.path.isfile(asset):
+                    assets.append(os.path.relpath(asset, base))
+            except ValueError:
+                # another drive, Blender cannot reach it by a relative path either
+                continue
+
+        index['relative_assets'][content_hash] = assets
+
+    return index['relative_assets'][content_hash]
+
+
+def evict(cfg, index, protected):
+    # least recently used blobs go first, blobs of the current project and of projects other workers render
+    # from are never evicted
+    max_size = float(cfg['cache']['max_size_gb']) * 1024 ** 3
+    total_size = sum(blob['size'] for blob in index['blobs'].values())
+
+    for content_hash, blob in sorted(index['blobs'].items(), key=lambda item: item[1]['last_used']):
+        if total_size <= max_size:
+            break
+        if content_hash in protected:
+            continue
+
+        views = [v for v, h in index['views'].items() if h == content_hash]
+        if any(is_project_in_use(cfg, project_name) for project_name in set(get_view_project(cfg, v) for v in views)):
+            continue
+
+        for view_path in views:
+            if os.path.exists(view_path):
+                os.remove(view_path)
+            del index['views'][view_path]
+
+        for source in [s for s, entry in index['sources'].items() if entry['hash'] == content_hash]:
+            del index['sources'][source]
+
+        if os.path.exists(get_blob_path(cfg, content_hash)):
+            os.remove(get_blob_path(cfg, content_hash))
+
+        del index['blobs'][content_hash]
+        index['relative_assets'].pop(content_hash, None)
+        total_size -= blob['size']
+
+        logging.debug('Evicted {} from the asset cache.'.format(content_hash))
+
+
+def prepare_project(cfg, project_name, source):
+    # returns the path of the cached .blend, the linked assets are laid out around it as in the source directory
+    with lock_index(cfg):
+        hold_project(cfg, project_name)
+        index = load_index(cfg)
+
+        content_hash = cache_file(cfg, index, source)
+        protected = {content_hash}
+
+        # assets above the folder of the .blend are mirrored from the common ancestor of all of them, so the
+        # relative paths resolved against the cached copy lead to the cached assets
+        base = os.path.dirname(os.path.abspath(source))
+        assets = get_relative_assets(cfg, index, source, content_hash)
+        root = os.path.commonpath([base] + [os.path.normpath(os.path.join(base, asset)) for asset in assets])
+
+        blend_directory = os.path.join(get_cache_path(cfg, 'views', project_name), os.path.relpath(base, root))
+        view_path = os.path.normpath(os.path.join(blend_directory, os.path.basename(source)))
+        link_view(cfg, index, view_path, content_hash)
+
+        for asset in assets:
+            try:
+                asset_hash = cache_file(cfg, index, os.path.join(base, asset))
+            except OSError as e:
+                logging.warning('The asset "{}" could not be cached: {}'.format(asset, e))
+                continue
+
+            link_view(cfg, index, os.path.normpath(os.path.join(blend_directory, asset)), asset_hash)
+            protected.add(asset_hash)
+
+        evict(cfg, index, protected)
+        save_index(cfg, index)
+
+    return view_path
@@ -0,0 +1,269 @@
+import database
+import dropbox_upload
+import project
+import worker
+import contextlib
+import tempfile
+import shutil
+import copy
+import threading
+import time
+import logging
+import os
+import datetime as dt
+from prettytable import PrettyTable
+
+
+_CREATION_FRAME_COUNTS = [100, 1000, 5000, 20000]
+_SCHEDULER_FRAME_COUNTS = [100, 1000, 10000, 100000]
+_FAKE_BLENDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_blender.py')
+
+
+def create_temporary_project(args, cfg, db, cursor, prefix, num_frames):
+    bench_args = copy.copy(args)
+    bench_args.project_name = '{}_{:%Y%m%d%H%M%S%f}'.format(prefix, dt.datetime.now())
+    bench_args.filename = 'benchmark.blend'
+    bench_args.num_frames = num_frames
+
+    project.start_project(bench_args, cfg, db, cursor)
+
+    return bench_args
+
+
+def delete_temporary_project(args, db, cursor):
+    # all history and frame rows are removed by the cascading foreign keys
+    database.execute_statement(db, cursor, 'DELETE FROM render_project WHERE project_name = %s;',
+                               (args.project_name,), commit=True)
+
+
+def stress_test_claims(args, cfg, db, cursor):
+    num_frames = args.num_frames if args.num_frames else 1000
+    workers = args.workers
+
+    bench_args = create_temporary_project(args, cfg, db, cursor, '_stress_claims', num_frames)
+    project.set_project_status(bench_args, cfg, db, cursor, 'RUNNING')
+
+    claimed = [[] for _ in range(workers)]
+
+    def claimer(slot):
+        worker_db, worker_cursor = database.connect_to_database(cfg)
+
+        while True:
+            frames = project.request_frames_to_render(bench_args, cfg, worker_db, worker_cursor)
+            if len(frames) == 0:
+                break
+            claimed[slot].extend(frames)
+
+        database.close_connection(worker_db, worker_cursor)
+
+    threads = [threading.Thread(target=claimer, args=(i,)) for i in range(workers)]
+
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    end_time = time.time() - start_time
+
+    all_frames = [f for frames in claimed for f in frames]
+    duplicates = len(all_frames) - len(set(all_frames))
+    missing = num_frames - len(set(all_frames))
+
+    delete_temporary_project(bench_args, db, cursor)
+
+    print('Claim stress test:')
+    print('\tWorkers:     {}'.format(workers))
+    print('\tFrames:      {}'.format(num_frames))
+    print('\tClaimed:     {}'.format(len(all_frames)))
+    print('\tDuplicates:  {}'.format(duplicates))
+    print('\tUnclaimed:   {}'.format(missing))
+    print('\tTime:        {:0.3f}s ({:0.1f} frames/s)'.format(end_time, len(all_frames) / max(end_time, 1e-9)))
+
+    if duplicates > 0 or missing > 0:
+        logging.error('Claim stress test failed: {} frame(s) handed out twice, {} frame(s) never claimed.'
+                      .format(duplicates, missing))
+        return False
+
+    logging.info('Claim stress test passed.')
+    return True
+
+
+def benchmark_project_creation(args, cfg, db, cursor):
+    frame_counts = [args.num_frames] if args.num_frames else _CREATION_FRAME_COUNTS
+
+    x = PrettyTable()
+    x.field_names = ['frames', 'time (s)', 'frames/s']
+
+    for num_frames in frame_counts:
+        start_time = time.time()
+        bench_args = create_temporary_project(args, cfg, db, cursor, '_bench_creation', num_frames)
+        end_time = time.time() - start_time
+
+        delete_temporary_project(bench_args, db, cursor)
+
+        x.add_row([num_frames, '{:0.3f}'.format(end_time), '{:0.1f}'.format(num_frames / max(end_time, 1e-9))])
+
+    print('Project creation benchmark:')
+    print(x)
+
+
+def percentile(values, p):
+    # nearest rank, good enough for latency reports
+    if len(values) == 0:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def local_upload_files(directory):
+    # copies the files into a local folder instead of uploading them to Dropbox
+    def upload_files(token, files, app_name, project_name, **kwargs):
+        target = os.path.join(directory, app_name, project_name)
+        os.makedirs(target, exist_ok=True)
+
+        try:
+            for file in files:
+                shutil.copyfile(file, os.path.join(target, os.path.basename(file)))
+        except IOError as e:
+            logging.error('Local upload failed: ' + str(e))
+            return False
+
+        return True
+
+    return upload_files
+
+
+def timed(function, latencies):
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start_time)
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def simulated_farm(cfg, directory, render_seconds):
+    # fake Blender, local uploads and latency probes for the calls every worker makes per batch
+    bench_cfg = copy.deepcopy(cfg)
+    bench_cfg['general']['blender_path'] = _FAKE_BLENDER
+    bench_cfg['general']['output_path'] = os.path.join(directory, 'render_images')
+    bench_cfg['general']['output_prefix'] = 'bench'
+    bench_cfg['render']['persistent_blender'] = False
+    bench_cfg['cache']['enabled'] = False
+
+    latencies = {'request_frames_to_render': [], 'set_frame_task_status': []}
+    claims = []
+
+    request_frames_to_render = project.request_frames_to_render
+    set_frame_task_status = project.set_frame_task_status
+    upload_files = dropbox_upload.upload_files
+    render_environment = os.environ.get('FAKE_BLENDER_SECONDS')
+
+    def claim(*args, **kwargs):
+        frames = request_frames_to_render(*args, **kwargs)
+        if len(frames) > 0:
+            claims.append(frames)
+        return frames
+
+    project.request_frames_to_render = timed(claim, latencies['request_frames_to_render'])
+    project.set_frame_task_status = timed(set_frame_task_status, latencies['set_frame_task_status'])
+    dropbox_upload.upload_files = local_upload_files(os.path.join(directory, 'uploads'))
+    os.environ['FAKE_BLENDER_SECONDS'] = str(render_seconds)
+
+    try:
+        yield bench_cfg, latencies, claims
+    finally:
+        project.request_frames_to_render = request_frames_to_render
+        project.set_frame_task_status = set_frame_task_status
+        dropbox_upload.upload_files = upload_files
+
+        if render_environment is None:
+            del os.environ['FAKE_BLENDER_SECONDS']
+        else:
+            os.environ['FAKE_BLENDER_SECONDS'] = render_environment
+
+
+def run_simulated_project(args, cfg, db, cursor, num_frames, render_seconds):
+    directory = tempfile.mkdtemp(prefix='render_farm_bench_')
+
+    try:
+        with simulated_farm(cfg, directory, render_seconds) as (bench_cfg, latencies, claims):
+            bench_args = create_temporary_project(args, bench_cfg, db, cursor, '_bench_scheduler', num_frames)
+            bench_args.one_batch = False
+            bench_args.some_batches = 0
+
+            def simulated_worker():
+                worker_db, worker_cursor = database.connect_to_database(bench_cfg)
+
+                try:
+                    worker.render_loop(bench_args, bench_cfg, worker_db, worker_cursor, 1)
+                except Exception as e:
+                    logging.critical('Simulated worker stopped because of an exception: ' + str(e))
+                finally:
+                    database.close_connection(worker_db, worker_cursor)
+
+            threads = [threading.Thread(target=simulated_worker, name='bench-{}'.format(i))
+                       for i in range(args.workers)]
+
+            start_time = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            makespan = time.time() - start_time
+
+            counts = project.get_frame_status_counts(bench_args, bench_cfg, db, cursor)
+            delete_temporary_project(bench_args, db, cursor)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    all_frames = [f for frames in claims for f in frames]
+
+    return {
+        'frames': num_frames,
+        'makespan': makespan,
+        'claims': len(claims),
+        'duplicates': len(all_frames) - len(set(all_frames)),
+        'unfinished': num_frames - counts['FINISHED'],
+        'request_frames_to_render': latencies['request_frames_to_render'],
+        'set_frame_task_status': latencies['set_frame_task_status']
+    }
+
+
+def format_latencies(latencies):
+    return ' / '.join('{:0.1f}'.format(percentile(latencies, p) * 1000) for p in [50, 95, 99])
+
+
+def benchmark_scheduler(args, cfg, db, cursor):
+    # end to end throughput of the coordinator, the renderer and the upload are simulated locally
+    frame_counts = [args.num_frames] if args.num_frames else _SCHEDULER_FRAME_COUNTS
+
+    x = PrettyTable()
+    x.field_names = ['frames', 'makespan (s)', 'claims/s', 'frames/s', 'claim p50/p95/p99 (ms)',
+                     'status p50/p95/p99 (ms)', 'duplicates', 'unfinished']
+
+    passed = True
+    for num_frames in frame_counts:
+        logging.info('Simulating {} worker(s) on a project with {} frames...'.format(args.workers, num_frames))
+        result = run_simulated_project(args, cfg, db, cursor, num_frames, args.render_seconds)
+
+        x.add_row([num_frames, '{:0.3f}'.format(result['makespan']),
+                   '{:0.1f}'.format(result['claims'] / max(result['makespan'], 1e-9)),
+                   '{:0.1f}'.format(num_frames / max(result['makespan'], 1e-9)),
+                   format_latencies(result['request_frames_to_render']),
+                   format_latencies(result['set_frame_task_status']),
+                   result['duplicates'], result['unfinished']])
+
+        if result['duplicates'] > 0 or result['unfinished'] > 0:
+            logging.error('Scheduler benchmark with {} frames: {} frame(s) handed out twice, {} frame(s) not finished.'
+                          .format(num_frames, result['duplicates'], result['unfinished']))
+            passed = False
+
+    print('Scheduler benchmark ({} workers, {:0.3f}s per frame):'.format(args.workers, args.render_seconds))
+    print(x)
+
+    return passed
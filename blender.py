@@ -0,0 +1,150 @@
+import subprocess
+import logging
+import json
+import os
+import re
+
+
+_DRIVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blender_driver.py')
+_RESULT_PREFIX = '@@RENDER_RESULT '
+
+
+# Fra:12 Mem:150.62M (Peak 151.44M) | Time:00:00.43 | ... (Cycles) or Fra:12 Mem:11.21M (0.00M, Peak 11.87M) | ...
+_FRAME_LINE = re.compile(r'^Fra:(\d+) .*?Peak:? ?([\d.]+)M')
+# Saved: '/path/to/render_frame_00012.png'
+_SAVED_LINE = re.compile(r"^Saved: '(.*)'")
+# Time: 00:01.56 (Saving: 00:00.02), printed once the frame is written
+_TIME_LINE = re.compile(r'^ ?Time: ((?:\d+:)?\d+:\d+(?:\.\d+)?)')
+
+
+def parse_duration(text):
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+
+    return seconds
+
+
+def parse_output_line(line, state, stats):
+    match = _FRAME_LINE.match(line)
+    if match:
+        frame = int(match.group(1))
+        if state.get('frame') != frame:
+            state.clear()
+            state['frame'] = frame
+
+        state['peak_memory_mb'] = max(state.get('peak_memory_mb', 0.0), float(match.group(2)))
+        return
+
+    match = _SAVED_LINE.match(line)
+    if match and 'frame' in state:
+        state['output_path'] = match.group(1)
+        return
+
+    match = _TIME_LINE.match(line)
+    if match and 'frame' in state:
+        stats.append({
+            'frame': state['frame'],
+            'render_seconds': parse_duration(match.group(1)),
+            'peak_memory_mb': state.get('peak_memory_mb'),
+            'output_path': state.get('output_path')
+        })
+        state.clear()
+
+
+def run_blender(command):
+    # the output is streamed instead of discarded, so the per frame statistics can be collected
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               universal_newlines=True, errors='replace')
+
+    state = {}
+    stats = []
+    for line in process.stdout:
+        line = line.rstrip()
+        logging.debug('Blender > ' + line)
+        parse_output_line(line, state, stats)
+
+    process.wait()
+
+    return process.returncode, stats
+
+
+def read_message(worker):
+    # skips the regular output of Blender until the driver reports back, None if Blender is gone
+    for line in worker['process'].stdout:
+        line = line.rstrip()
+
+        if line.startswith(_RESULT_PREFIX):
+            return json.loads(line[len(_RESULT_PREFIX):])
+
+        logging.debug('Blender > ' + line)
+        parse_output_line(line, worker['state'], worker['stats'])
+
+    return None
+
+
+def start_worker(blender_path, filename, threads=0):
+    command = [blender_path, '-b', filename, '--python', _DRIVER_SCRIPT, '--']
+    if threads > 0:
+        command += ['--threads', str(threads)]
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               universal_newlines=True, errors='replace', bufsize=1)
+    worker = {'process': process, 'filename': filename, 'threads': threads, 'state': {}, 'stats': []}
+
+    if read_message(worker) is None:
+        process.wait()
+        logging.error('The persistent Blender process for "{}" did not start (exit code {}).'.format(
+            filename, process.returncode))
+        return None
+
+    logging.info('Started a persistent Blender process for "{}".'.format(filename))
+    return worker
+
+
+def is_worker_alive(worker):
+    return worker is not None and not worker.get('crashed') and worker['process'].poll() is None
+
+
+def render_with_worker(worker, frames, output):
+    # returns the results of the frames rendered before Blender stopped, the rest stays unrendered
+    results = []
+
+    for frame in frames:
+        try:
+            worker['process'].stdin.write(json.dumps({'frame': frame, 'output': output}) + '\n')
+            worker['process'].stdin.flush()
+        except (IOError, ValueError):
+            worker['crashed'] = True
+            break
+
+        result = read_message(worker)
+        if result is None:
+            worker['crashed'] = True
+            break
+
+        peak_memory = [stat['peak_memory_mb'] for stat in worker['stats'] if stat['frame'] == frame]
+        result['peak_memory_mb'] = peak_memory[-1] if len(peak_memory) > 0 else worker['state'].get('peak_memory_mb')
+        worker['stats'] = []
+        worker['state'].clear()
+
+        if not result['ok']:
+            logging.error('Blender could not render frame {}: {}'.format(frame, result.get('error')))
+            continue
+
+        results.append(result)
+
+    return results
+
+
+def stop_worker(worker):
+    if not is_worker_alive(worker):
+        return
+
+    try:
+        worker['process'].stdin.write(json.dumps({'quit': True}) + '\n')
+        worker['process'].stdin.close()
+        worker['process'].wait(timeout=60)
+    except Exception as e:
+        logging.warning('The persistent Blender process did not stop cleanly, killing it: ' + str(e))
+        worker['process'].kill()
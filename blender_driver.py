@@ -0,0 +1,63 @@
+# runs inside Blender: blender -b <file> --python blender_driver.py -- [--threads N]
+# keeps the scene loaded and renders the frames requested on stdin, one JSON object per line
+import bpy
+import sys
+import json
+import time
+
+
+_RESULT_PREFIX = '@@RENDER_RESULT '
+
+
+def get_threads():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+
+    if '--threads' in argv:
+        return int(argv[argv.index('--threads') + 1])
+
+    return 0
+
+
+def send(message):
+    sys.stdout.write(_RESULT_PREFIX + json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+
+def render_frame(scene, frame, output):
+    start_time = time.time()
+
+    scene.frame_set(frame)
+    scene.render.filepath = output
+    bpy.ops.render.render(write_still=True)
+
+    return {
+        'frame': frame,
+        'ok': True,
+        'output_path': scene.render.frame_path(frame=frame),
+        'render_seconds': time.time() - start_time
+    }
+
+
+def main():
+    scene = bpy.context.scene
+
+    threads = get_threads()
+    if threads > 0:
+        scene.render.threads_mode = 'FIXED'
+        scene.render.threads = threads
+
+    send({'ready': True})
+
+    for line in sys.stdin:
+        request = json.loads(line)
+
+        if request.get('quit'):
+            break
+
+        try:
+            send(render_frame(scene, request['frame'], request['output']))
+        except Exception as e:
+            send({'frame': request['frame'], 'ok': False, 'error': str(e)})
+
+
+main()
@@ -0,0 +1,45 @@
+# runs inside Blender: blender -b --python blender_stitch.py -- <output> <tiles_x> <tiles_y> <tile> ...
+# joins the cropped border renders of one frame, the tiles are given row by row starting at the bottom left
+import bpy
+import numpy as np
+import sys
+
+
+def load_pixels(path):
+    image = bpy.data.images.load(path)
+    width, height = image.size
+
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    bpy.data.images.remove(image)
+
+    return pixels.reshape(height, width, 4)
+
+
+def stitch(tiles, tiles_x, tiles_y):
+    # the tiles of a row have the same height and all rows the same width, so the offsets follow from the sizes
+    rows = [np.concatenate(tiles[y * tiles_x:(y + 1) * tiles_x], axis=1) for y in range(tiles_y)]
+    return np.concatenate(rows, axis=0)
+
+
+def save_pixels(pixels, path):
+    height, width = pixels.shape[:2]
+
+    image = bpy.data.images.new('stitched', width, height, alpha=True)
+    image.pixels.foreach_set(pixels.ravel())
+    image.filepath_raw = path
+    image.file_format = 'PNG'
+    image.save()
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:]
+    output, tiles_x, tiles_y, paths = argv[0], int(argv[1]), int(argv[2]), argv[3:]
+
+    if len(paths) != tiles_x * tiles_y:
+        raise ValueError('Expected {} tiles, got {}.'.format(tiles_x * tiles_y, len(paths)))
+
+    save_pixels(stitch([load_pixels(path) for path in paths], tiles_x, tiles_y), output)
+
+
+main()
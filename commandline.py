@@ -1,7 +1,13 @@
 import argparse
 import config
 import database
+import dispatcher
+import frame_range
 import project
+import benchmark
+import worker
+import metrics
+import time
 import logging
 
 
@@ -31,6 +37,15 @@ def add_action_parameters(parser):
     parser.add_argument('--project_name', type=str, default='', help='') # TODO add help
     parser.add_argument('--filename', type=str, help='')  # TODO add help
     parser.add_argument('--num_frames', type=int, help='')  # TODO add help
+    parser.add_argument('--priority', type=int, default=0,
+                        help='scheduling priority of the project for the worker daemon, higher is served first')
+    parser.add_argument('--tiles_x', type=int, default=1,
+                        help='split every frame into this many border render tiles horizontally')
+    parser.add_argument('--tiles_y', type=int, default=1,
+                        help='split every frame into this many border render tiles vertically')
+    parser.add_argument('--sample_step', type=int, default=0,
+                        help='render every n-th frame first, then the remaining frames by their interpolated render '
+                             'time, longest first, 0 renders the frames in order')
 
     # for cancelling
     parser.add_argument('--project', action='store_true', help='')
@@ -44,6 +59,16 @@ def add_action_parameters(parser):
     # for project status
     parser.add_argument('--history', action='store_true', help='') # TODO add help
     parser.add_argument('--frame_list', action='store_true', help='') # TODO add help
+    parser.add_argument('--json', action='store_true', help='print the project status as a single JSON object')
+    parser.add_argument('--list_format', type=str, default='table', choices=['table', 'csv', 'json', 'ranges'],
+                        help='format of the frame list, "csv" and "json" (one object per line) are streamed without '
+                             'the project status, "ranges" summarizes runs of frames with the same status')
+    parser.add_argument('--status', type=str, default=None, help='only list the frames with this status')
+    parser.add_argument('--machine', type=str, default=None, help='only list the frames of this render machine')
+    parser.add_argument('--frame_range', type=str, default=None, help='only list these frames, e.g. "0-99, 120"')
+    parser.add_argument('--after', type=int, default=None,
+                        help='only list the frames after this one, to page through the list together with --limit')
+    parser.add_argument('--limit', type=int, default=0, help='list at most this many frames, 0 lists all')
 
     # for freeing
     parser.add_argument('--free_failed', action='store_true', help='')
@@ -52,6 +77,27 @@ def add_action_parameters(parser):
     # for rendering
     parser.add_argument('--one_batch', action='store_true', help='')  # TODO add help
     parser.add_argument('--some_batches', type=int, default=0, help='')  # TODO add help
+    parser.add_argument('--slots', type=int, default=1,
+                        help='number of batches rendered in parallel, the cores are split evenly between them')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='claim the next batch while rendering and upload finished batches in the background')
+
+    # for monitoring
+    parser.add_argument('--metrics_port', type=int, default=None,
+                        help='port of the Prometheus metrics endpoint, overrides the config, 0 disables it')
+
+    # for database maintenance
+    parser.add_argument('--partition_history', action='store_true',
+                        help='also partition the frame task history by project, this drops its foreign keys')
+
+    # for benchmarking
+    parser.add_argument('--suite', type=str, default='claims', choices=['claims', 'creation', 'scheduler'],
+                        help='the benchmark to run, "claims" stress tests concurrent frame claiming, '
+                             '"creation" measures the project creation time against the number of frames, '
+                             '"scheduler" renders whole projects with a fake Blender and local uploads')
+    parser.add_argument('--workers', type=int, default=8, help='number of concurrent simulated workers')
+    parser.add_argument('--render_seconds', type=float, default=0.01,
+                        help='time the fake Blender of the scheduler benchmark takes per frame')
 
 
 def parse_and_execute_actions(args):
@@ -77,6 +123,10 @@ def parse_and_execute_actions(args):
         database.setup_database(cfg)
         return
 
+    if args.action == 'migrate-database':
+        database.migrate_database(cfg, args.partition_history)
+        return
+
     db, cursor = database.connect_to_database(cfg)
 
     if not project.is_machine_registered(cfg, db, cursor):
@@ -87,6 +137,10 @@ def parse_and_execute_actions(args):
             logging.error('Project name "{}" is not a valid choice!'.format(args.project_name))
         elif project.check_if_project_name_taken(args, db, cursor):
             logging.error('Project name "{}" is already taken!'.format(args.project_name))
+        elif args.tiles_x < 1 or args.tiles_y < 1:
+            logging.error('The number of tiles must be at least 1 in both directions!')
+        elif args.sample_step < 0:
+            logging.error('The sample step must not be negative!')
         else:
             project.start_project(args, cfg, db, cursor)
 
@@ -108,24 +162,52 @@ def parse_and_execute_actions(args):
             logging.error('Project name "{}" is not a valid choice!'.format(args.project_name))
         elif not project.check_if_project_name_taken(args, db, cursor):
             logging.error('Project name "{}" does not exist!'.format(args.project_name))
+        elif args.status is not None and not project.is_frame_status_valid(args.status):
+            pass
+        elif args.frame_range is not None and not frame_range.is_range_text_valid(args.frame_range):
+            logging.error('The frame range "{}" is not valid, use e.g. "0-99, 120"!'.format(args.frame_range))
+        elif args.frame_list and args.list_format in ['csv', 'json']:
+            project.print_project_frame_list(args, cfg, db, cursor)
         else:
             project.get_project_info(args, cfg, db, cursor)
 
             if args.history:
                 pass
 
-            elif args.frame_list:
-                print(project.get_project_frame_list(args, cfg, db, cursor))
-
-    elif args.action == 'render':
-        if args.one_batch:
-            project.render_frames(args, cfg, db, cursor)
-        elif args.some_batches > 0:
-            for _ in range(args.some_batches):
-                project.render_frames(args, cfg, db, cursor)
-        else:
-            while project.has_project_open_frames(args, cfg, db, cursor):
-                project.render_frames(args, cfg, db, cursor)
+            elif args.frame_list and not args.json:
+                project.print_project_frame_list(args, cfg, db, cursor)
+
+    elif args.action in ['render', 'worker']:
+        with metrics.serve(cfg, args.metrics_port), worker.lease_heartbeat(cfg):
+            if args.slots > 1:
+                worker.run_slots(args, cfg)
+            else:
+                worker.run_worker(args, cfg, db, cursor)
+
+    elif args.action == 'benchmark':
+        if args.suite == 'claims':
+            benchmark.stress_test_claims(args, cfg, db, cursor)
+        elif args.suite == 'creation':
+            benchmark.benchmark_project_creation(args, cfg, db, cursor)
+        elif args.suite == 'scheduler':
+            benchmark.benchmark_scheduler(args, cfg, db, cursor)
+
+    elif args.action == 'dispatcher':
+        dispatcher.serve(cfg)
+
+    elif args.action == 'metrics':
+        # exports the queue depth of all open projects until interrupted
+        project.collect_queue_depth(cfg)
+
+        try:
+            with metrics.serve(cfg, args.metrics_port):
+                while True:
+                    time.sleep(3600)
+        except KeyboardInterrupt:
+            logging.info('Metrics export stopped.')
+
+    elif args.action == 'compact-history':
+        project.compact_history(args, cfg, db, cursor)
 
     elif args.action == 'free':
         if args.free_failed:
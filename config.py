@@ -13,18 +13,64 @@ def get_default_config():
             'blender_path': ''
         },
         'database': {
+            'backend': 'mysql',
+            'sqlite_path': 'render_farm.sqlite',
             'host': '',
             'port': '',
             'user': '',
             'pw': '',
-            'db': ''
+            'db': '',
+            'pool_size': 5,
+            'retries': 8,
+            'retry_delay': 0.5,
+            'max_retry_delay': 30.0
         },
         'dropbox': {
             'access_token': '',
-            'folder_name': ''
+            'folder_name': '',
+            'chunk_size_mb': 8,
+            'parallel_uploads': 4
         },
         'render': {
-            'frames_per_task': 5
+            'frames_per_task': 5,
+            'upload_queue_size': 2,
+            'lease_seconds': 600,
+            'heartbeat_interval': 60,
+            'adaptive_batch': False,
+            'target_batch_seconds': 300,
+            'max_frames_per_task': 50,
+            'smoothing': 0.3,
+            'persistent_blender': False
+        },
+        'cache': {
+            'enabled': False,
+            'path': 'asset_cache',
+            'max_size_gb': 50
+        },
+        'worker': {
+            'policy': 'fair_share',
+            'idle_backoff': 5,
+            'max_idle_backoff': 300
+        },
+        # failures_per_machine may be lower than max_attempts, a frame then gets its last attempts on other
+        # machines, frames that no machine outside of quarantine may take anymore are given up right away
+        'retry': {
+            'max_attempts': 3,
+            'delay': 60,
+            'max_delay': 3600,
+            'failures_per_machine': 2,
+            'quarantine_failures': 5,
+            'quarantine_seconds': 1800
+        },
+        'metrics': {
+            'port': 0,
+            'textfile': '',
+            'interval': 15
+        },
+        'dispatcher': {
+            'address': '',
+            'flush_interval': 0.5,
+            'refresh_interval': 10
         }
     }
 
@@ -59,7 +105,14 @@ def create_config_interactively(config_filename):
 def load_config(config_filename):
     try:
         with open(config_filename, 'r', encoding='utf8') as f:
-            return json.load(f)
+            config = json.load(f)
+
+        # parameters added after the config file was created fall back to their defaults
+        for top_level_key, defaults in get_default_config().items():
+            for low_level_key, value in defaults.items():
+                config.setdefault(top_level_key, {}).setdefault(low_level_key, value)
+
+        return config
     except Exception as e:
         logging.critical('Exception occurred ({}), run validate-config'.format(e))
 
@@ -1,22 +1,82 @@
-import mysql.connector
+import metrics
+import importlib
+import contextlib
+import sqlite3
+import random
+import time
 import os
 import logging
 
 
-def connect_to_database(cfg):
+_INSERT_CHUNK_SIZE = 1000
+_FETCH_SIZE = 1000
+
+# the MySQL connector is only imported when the MySQL backend is used
+_BACKENDS = {
+    'mysql': 'database_mysql',
+    'sqlite': 'database_sqlite'
+}
+
+_retry_settings = {
+    'retries': 8,
+    'retry_delay': 0.5,
+    'max_retry_delay': 30.0
+}
+
+_open_transactions = set()
+
+
+def get_backend(name):
+    if name not in _BACKENDS:
+        raise ValueError('Unknown database backend "{}", choose one of {}.'.format(name, ', '.join(_BACKENDS)))
+
+    return importlib.import_module(_BACKENDS[name])
+
+
+def get_connection_backend(db):
+    return get_backend('sqlite' if isinstance(db, sqlite3.Connection) else 'mysql')
+
+
+def _wait_for_retry(attempt, e):
+    # exponential backoff with jitter, capped so a long outage is polled at a steady rate
+    delay = min(_retry_settings['max_retry_delay'], _retry_settings['retry_delay'] * 2 ** attempt)
+    delay *= random.uniform(0.5, 1.0)
+
+    logging.warning('Transient database error ({}), retrying in {:0.1f}s (attempt {} of {}).'.format(
+        e, delay, attempt + 1, _retry_settings['retries']))
+    time.sleep(delay)
+
+
+def _reconnect(db):
     try:
-        db = mysql.connector.connect(
-            host=cfg['database']['host'],
-            user=cfg['database']['user'],
-            passwd=cfg['database']['pw'],
-            port=cfg['database']['port'],
-            database=cfg['database']['db']
-        )
-
-        return db, db.cursor(buffered=False)
+        get_connection_backend(db).reconnect(db)
     except Exception as e:
-        logging.critical('The database connector produced an error, '
-                         'when trying to connect to the database: ' + str(e))
+        logging.warning('Reconnecting to the database failed: ' + str(e))
+
+
+def connect_to_database(cfg):
+    for key in _retry_settings:
+        _retry_settings[key] = type(_retry_settings[key])(cfg['database'][key])
+
+    try:
+        backend = get_backend(cfg['database']['backend'])
+    except (ValueError, ImportError) as e:
+        logging.critical('The database backend could not be loaded: ' + str(e))
+        return
+
+    attempt = 0
+    while True:
+        try:
+            return backend.connect(cfg)
+        except Exception as e:
+            if backend.is_transient_error(e) and attempt < _retry_settings['retries']:
+                _wait_for_retry(attempt, e)
+                attempt += 1
+                continue
+
+            logging.critical('The database connector produced an error, '
+                             'when trying to connect to the database: ' + str(e))
+            return
 
 
 def close_connection(db, cursor):
@@ -29,33 +89,211 @@ def close_connection(db, cursor):
                          + str(e))
 
 
-def execute_statement(db, cursor, sql, params, with_result=False, multi=False, commit=False):
+def commit(db):
+    try:
+        db.commit()
+    except Exception as e:
+        logging.critical('The database connector produced an error, '
+                         'when trying to commit the transaction: ' + str(e))
+
+
+def rollback(db):
+    try:
+        db.rollback()
+    except Exception as e:
+        logging.critical('The database connector produced an error, '
+                         'when trying to roll back the transaction: ' + str(e))
+
+
+@contextlib.contextmanager
+def transaction(db, cursor):
+    # nested transactions take part in the outermost one, which commits or rolls back everything
+    if id(db) in _open_transactions:
+        yield
+        return
+
+    _open_transactions.add(id(db))
     try:
-        cursor.execute(sql, params, multi=multi)
-        if commit:
-            db.commit()
+        get_connection_backend(db).begin(db)
+        yield
+        db.commit()
+    except Exception:
+        rollback(db)
+        raise
+    finally:
+        _open_transactions.discard(id(db))
+
+
+def run_in_transaction(db, cursor, function, *args):
+    # the whole unit of work is repeated on transient errors, a single statement cannot be
+    # replayed once the connection and with it the open transaction is lost
+    nested = id(db) in _open_transactions
+
+    attempt = 0
+    while True:
+        try:
+            with transaction(db, cursor):
+                return function(*args)
+        except Exception as e:
+            if nested:
+                raise
+
+            if get_connection_backend(db).is_transient_error(e) and attempt < _retry_settings['retries']:
+                _wait_for_retry(attempt, e)
+                _reconnect(db)
+                attempt += 1
+                continue
+
+            logging.critical('The transaction could not be completed: ' + str(e))
+            return
+
 
-        if with_result:
-            return cursor.fetchall()
+def execute_statement(db, cursor, sql, params, with_result=False, multi=False, commit=False):
+    in_transaction = id(db) in _open_transactions
+    backend = get_connection_backend(db)
+
+    attempt = 0
+    while True:
+        try:
+            with metrics.timer('db_statement_seconds'):
+                backend.execute(cursor, backend.translate(sql), params, multi=multi)
+                if commit and not in_transaction:
+                    db.commit()
+
+                if with_result:
+                    return cursor.fetchall()
+
+            return
+
+        except Exception as e:
+            if in_transaction:
+                # let the transaction roll back as a whole
+                logging.error('The statement ("{}") could not be executed: {}'.format(sql, e))
+                raise
 
+            if backend.is_transient_error(e) and attempt < _retry_settings['retries']:
+                _wait_for_retry(attempt, e)
+                _reconnect(db)
+                attempt += 1
+                continue
+
+            logging.critical('The statement ("{}") could not be executed: {}'.format(sql, e))
+            return
+
+
+def stream_statement(db, cursor, sql, params):
+    # yields the rows in batches instead of fetching the whole result, the cursor of the MySQL backend is
+    # unbuffered, so the rows are read from the server as they are consumed and have to be read to the end
+    backend = get_connection_backend(db)
+
+    try:
+        backend.execute(cursor, backend.translate(sql), params)
     except Exception as e:
         logging.critical('The statement ("{}") could not be executed: {}'.format(sql, e))
+        return
+
+    while True:
+        rows = cursor.fetchmany(_FETCH_SIZE)
+        if len(rows) == 0:
+            break
+
+        yield from rows
+
+
+def chunked(items, chunk_size=_INSERT_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+def insert_rows(db, cursor, table, columns, rows, ignore=False, commit=False, chunk_size=_INSERT_CHUNK_SIZE):
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    for chunk in chunked(rows, chunk_size):
+        sql = 'INSERT {}INTO {} ({}) VALUES {};'.format(
+            'IGNORE ' if ignore else '', table, ', '.join(columns), ', '.join([placeholders] * len(chunk)))
+
+        execute_statement(db, cursor, sql, tuple(value for row in chunk for value in row))
+
+    if commit and id(db) not in _open_transactions:
+        db.commit()
+
+
+def get_script_path(*parts):
+    return os.path.join(os.getcwd(), 'database', *parts)
+
+
+def execute_script(db, cursor, path):
+    with open(path, 'r') as f:
+        get_connection_backend(db).execute_script(db, cursor, f.read())
+
+    db.commit()
+
+
+def get_migrations(backend):
+    path = get_script_path(backend.MIGRATIONS)
+    if not os.path.isdir(path):
+        return []
+
+    return sorted(f[:-len('.sql')] for f in os.listdir(path) if f.endswith('.sql'))
+
+
+def mark_migration_applied(db, cursor, version):
+    execute_statement(db, cursor, '''
+    INSERT INTO schema_migration (version, applied_date) VALUES (%s, UTC_TIMESTAMP(6));
+    ''', (version,), commit=True)
 
 
 def setup_database(cfg):
+    backend = get_backend(cfg['database']['backend'])
+    db, cursor = connect_to_database(cfg)
+
+    backend.drop_tables(cfg, db, cursor)
+    execute_script(db, cursor, get_script_path(backend.SETUP_SCRIPT))
+
+    # the setup script always is the latest schema, so all migrations are part of it already
+    for version in get_migrations(backend):
+        mark_migration_applied(db, cursor, version)
+
+    close_connection(db, cursor)
+
+    logging.info('The database was successfully set up.')
+
+
+def migrate_database(cfg, partition_history=False):
+    # brings an existing database to the latest schema without dropping any data
+    backend = get_backend(cfg['database']['backend'])
     db, cursor = connect_to_database(cfg)
 
-    execute_statement(db, cursor, 'USE {};'.format(cfg['database']['db']), ())
-    execute_statement(db, cursor, 'SHOW TABLES;', ())
+    execute_statement(db, cursor, '''
+    CREATE TABLE IF NOT EXISTS schema_migration
+    (
+        version VARCHAR(100) NOT NULL,
+        applied_date DATETIME(6) NOT NULL,
+        CONSTRAINT schema_migration_pk
+            PRIMARY KEY (version)
+    );
+    ''', (), commit=True)
 
-    tables = cursor
+    result = execute_statement(db, cursor, 'SELECT version FROM schema_migration;', (), with_result=True)
+    applied = set(row[0] for row in result or [])
 
-    for table in tables:
-        execute_statement(db, cursor, 'DROP TABLE {};'.format(table[0].decode('utf-8')), ())
+    for version in get_migrations(backend):
+        if version in applied:
+            continue
 
-    with open(os.path.join(os.getcwd(), 'database', 'setup.sql'), 'r') as f:
-        execute_statement(db, cursor, ' '.join(f.readlines()), (), multi=True)
+        # MySQL commits every DDL statement right away, a failed migration has to be fixed by hand
+        logging.info('Applying migration "{}"...'.format(version))
+        execute_script(db, cursor, get_script_path(backend.MIGRATIONS, version + '.sql'))
+        mark_migration_applied(db, cursor, version)
+
+    if partition_history:
+        if cfg['database']['backend'] == 'mysql':
+            logging.info('Partitioning the frame task history...')
+            execute_script(db, cursor, get_script_path('partition_history.sql'))
+        else:
+            logging.warning('Partitioning is only supported by the MySQL backend.')
 
     close_connection(db, cursor)
 
-    logging.info('The database was successfully set up.')
+    logging.info('The database is up to date.')
@@ -0,0 +1,68 @@
+-- upgrades the original schema: current status table, leases, priorities and render statistics
+
+ALTER TABLE frame_task_history
+	MODIFY change_date DATETIME(6) NOT NULL;
+
+-- the new columns are filled from the history before they become mandatory
+ALTER TABLE frame_task
+	ADD COLUMN change_date DATETIME(6) NULL,
+	ADD COLUMN machine_id INT NULL,
+	ADD COLUMN status INT NULL,
+	ADD COLUMN lease_expires DATETIME(6) NULL;
+
+-- the original schema never wrote frame_task rows, the current status of every frame is the latest
+-- entry of its history, running reservations get one lease period before they can be reclaimed
+INSERT INTO frame_task (render_project_id, frame_index, change_date, machine_id, status, lease_expires)
+	SELECT h.render_project_id, h.frame_index, h.change_date, h.machine_id, h.status,
+			CASE WHEN fts.status_name = 'RESERVED' THEN DATE_ADD(UTC_TIMESTAMP(6), INTERVAL 600 SECOND) END
+		FROM frame_task_history h
+			JOIN frame_task_status fts
+				ON fts.id = h.status
+			JOIN (
+				SELECT render_project_id, frame_index, MAX(change_date) AS max_date FROM frame_task_history
+					GROUP BY render_project_id, frame_index
+			) latest ON latest.render_project_id = h.render_project_id
+				AND latest.frame_index = h.frame_index AND latest.max_date = h.change_date
+	ON DUPLICATE KEY UPDATE change_date = VALUES(change_date),
+		machine_id = VALUES(machine_id),
+		status = VALUES(status),
+		lease_expires = VALUES(lease_expires);
+
+ALTER TABLE frame_task
+	MODIFY change_date DATETIME(6) NOT NULL,
+	MODIFY status INT NOT NULL,
+	ADD CONSTRAINT frame_task_frame_task_status_id_fk
+		FOREIGN KEY (status) REFERENCES frame_task_status (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	ADD CONSTRAINT frame_task_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE;
+
+CREATE INDEX frame_task_render_project_id_status_frame_index_index
+	ON frame_task (render_project_id, status, frame_index);
+
+ALTER TABLE render_project
+	ADD COLUMN priority INT NOT NULL DEFAULT 0;
+
+CREATE TABLE frame_render_metric
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	machine_id INT NOT NULL,
+	render_date DATETIME(6) NOT NULL,
+	render_seconds DOUBLE NULL,
+	peak_memory_mb DOUBLE NULL,
+	output_path VARCHAR(255) NULL,
+	blender_exit_code INT NULL,
+	CONSTRAINT frame_render_metric_pk
+		PRIMARY KEY (render_project_id, frame_index, machine_id, render_date),
+	CONSTRAINT frame_render_metric_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_render_metric_render_project_id_fk
+		FOREIGN KEY (render_project_id) REFERENCES render_project (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE INDEX frame_render_metric_machine_id_index
+	ON frame_render_metric (machine_id);
@@ -0,0 +1,32 @@
+-- the unique index duplicated the primary key of frame_task_history
+
+DROP INDEX task_history_render_project_id_frame_index_change_date_uindex
+	ON frame_task_history;
+
+CREATE INDEX frame_task_history_render_project_id_change_date_index
+	ON frame_task_history (render_project_id, change_date);
+
+CREATE INDEX frame_task_render_project_id_machine_id_status_index
+	ON frame_task (render_project_id, machine_id, status);
+
+CREATE TABLE frame_task_history_archive
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	machine_id INT NULL,
+	status INT NOT NULL,
+	first_change_date DATETIME(6) NOT NULL,
+	last_change_date DATETIME(6) NOT NULL,
+	number_of_changes INT NOT NULL,
+	CONSTRAINT frame_task_history_archive_pk
+		PRIMARY KEY (render_project_id, frame_index),
+	CONSTRAINT frame_task_history_archive_frame_task_status_id_fk
+		FOREIGN KEY (status) REFERENCES frame_task_status (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_task_history_archive_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_task_history_archive_render_project_id_fk
+		FOREIGN KEY (render_project_id) REFERENCES render_project (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
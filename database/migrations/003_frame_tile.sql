@@ -0,0 +1,31 @@
+-- tile-split rendering: number of tiles per frame of a project and the tiles to claim
+
+ALTER TABLE render_project
+	ADD COLUMN tiles_x INT NOT NULL DEFAULT 1,
+	ADD COLUMN tiles_y INT NOT NULL DEFAULT 1;
+
+-- border render tiles of the frames of tiled projects, claimed like frames, the frame is stitched once all are in
+CREATE TABLE frame_tile
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	tile_index INT NOT NULL,
+	change_date DATETIME(6) NOT NULL,
+	machine_id INT NULL,
+	status INT NOT NULL,
+	lease_expires DATETIME(6) NULL,
+	CONSTRAINT frame_tile_pk
+		PRIMARY KEY (render_project_id, frame_index, tile_index),
+	CONSTRAINT frame_tile_frame_task_fk
+		FOREIGN KEY (render_project_id, frame_index) REFERENCES frame_task (render_project_id, frame_index)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_tile_frame_task_status_id_fk
+		FOREIGN KEY (status) REFERENCES frame_task_status (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_tile_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE INDEX frame_tile_render_project_id_status_frame_index_index
+	ON frame_tile (render_project_id, status, frame_index);
@@ -0,0 +1,27 @@
+-- automatic retries: attempts and backoff per frame, failures per frame and machine, machine quarantine
+
+ALTER TABLE render_machine
+	ADD COLUMN consecutive_failures INT NOT NULL DEFAULT 0,
+	ADD COLUMN quarantined_until DATETIME(6) NULL;
+
+ALTER TABLE frame_task
+	ADD COLUMN attempts INT NOT NULL DEFAULT 0,
+	ADD COLUMN retry_after DATETIME(6) NULL;
+
+-- failed render attempts of a frame per machine, frames that keep failing on a machine are left to the others
+CREATE TABLE frame_failure
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	machine_id INT NOT NULL,
+	failures INT NOT NULL,
+	last_failure DATETIME(6) NOT NULL,
+	CONSTRAINT frame_failure_pk
+		PRIMARY KEY (render_project_id, frame_index, machine_id),
+	CONSTRAINT frame_failure_frame_task_fk
+		FOREIGN KEY (render_project_id, frame_index) REFERENCES frame_task (render_project_id, frame_index)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_failure_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
@@ -0,0 +1,10 @@
+-- sample first projects: the sampling step per project and the interpolated render time per frame
+
+ALTER TABLE render_project
+	ADD COLUMN sample_step INT NOT NULL DEFAULT 0;
+
+ALTER TABLE frame_task
+	ADD COLUMN estimated_seconds DOUBLE NULL;
+
+CREATE INDEX frame_task_render_project_id_status_estimated_seconds_index
+	ON frame_task (render_project_id, status, estimated_seconds);
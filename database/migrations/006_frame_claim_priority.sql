@@ -0,0 +1,18 @@
+-- sample first projects: the claim order of a frame as one indexable value, the rank of the frame above
+-- its position, the sample frames rank highest, the other frames by their estimate in tenths of a second
+
+ALTER TABLE frame_task
+	ADD COLUMN claim_priority BIGINT NOT NULL DEFAULT 0;
+
+UPDATE frame_task ft
+	JOIN render_project rp
+		ON rp.id = ft.render_project_id
+	SET ft.claim_priority = CASE
+			WHEN rp.sample_step > 0 AND MOD(ft.frame_index, rp.sample_step) = 0 THEN 4194303
+			ELSE LEAST(ROUND(COALESCE(ft.estimated_seconds, 0) * 10), 4194302)
+		END * 2147483648 + 2147483647 - ft.frame_index;
+
+DROP INDEX frame_task_render_project_id_status_estimated_seconds_index ON frame_task;
+
+CREATE INDEX frame_task_render_project_id_status_claim_priority_index
+	ON frame_task (render_project_id, status, claim_priority DESC);
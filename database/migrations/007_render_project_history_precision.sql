@@ -0,0 +1,4 @@
+-- a project is often started and set running in the same second, the status changes are keyed by their date
+
+ALTER TABLE render_project_history
+	MODIFY change_date DATETIME(6) NOT NULL;
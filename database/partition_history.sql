@@ -0,0 +1,11 @@
+-- optional: spreads frame_task_history over partitions by project, so compaction and per project
+-- queries only touch one partition. MySQL does not support foreign keys on partitioned tables,
+-- so they are dropped, the application keeps the references consistent.
+
+ALTER TABLE frame_task_history
+	DROP FOREIGN KEY frame_task_history_frame_task_status_id_fk,
+	DROP FOREIGN KEY frame_task_history_render_machine_id_fk,
+	DROP FOREIGN KEY frame_task_history_render_project_id_fk;
+
+ALTER TABLE frame_task_history
+	PARTITION BY HASH (render_project_id) PARTITIONS 16;
@@ -0,0 +1,233 @@
+-- the schema of database/setup.sql for the SQLite backend, INTEGER primary keys are assigned automatically
+
+
+CREATE TABLE render_project
+(
+	id INTEGER NOT NULL,
+	project_name VARCHAR(100) NOT NULL,
+	filename VARCHAR(100) NOT NULL,
+	number_of_frames INT NOT NULL,
+	priority INT NOT NULL DEFAULT 0,
+	tiles_x INT NOT NULL DEFAULT 1,
+	tiles_y INT NOT NULL DEFAULT 1,
+	sample_step INT NOT NULL DEFAULT 0,
+	CONSTRAINT render_project_pk
+		PRIMARY KEY (id)
+);
+
+CREATE UNIQUE INDEX render_project_project_name_uindex
+	ON render_project (project_name);
+
+CREATE TABLE render_project_status
+(
+	id INTEGER NOT NULL,
+	status_name VARCHAR(30) NOT NULL,
+	CONSTRAINT render_project_status_pk
+		PRIMARY KEY (id)
+);
+
+CREATE UNIQUE INDEX render_project_status_status_name_uindex
+	ON render_project_status (status_name);
+
+INSERT INTO render_project_status (status_name) VALUES
+  ('CREATED'), ('RUNNING'), ('FINISHED'), ('CANCELLED');
+
+CREATE TABLE render_project_history
+(
+	render_project_id INT NOT NULL,
+	change_date DATETIME(6) NOT NULL,
+	status INT NOT NULL,
+	CONSTRAINT render_project_history_pk
+		PRIMARY KEY (render_project_id, change_date),
+	CONSTRAINT render_project_history_render_project_id_fk
+		FOREIGN KEY (render_project_id) REFERENCES render_project (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE TABLE render_machine
+(
+	id INTEGER NOT NULL,
+	machine_name VARCHAR(50) NOT NULL,
+	consecutive_failures INT NOT NULL DEFAULT 0,
+	quarantined_until DATETIME(6) NULL,
+	CONSTRAINT render_machine_pk
+		PRIMARY KEY (id)
+);
+
+CREATE UNIQUE INDEX render_machine_machine_name_uindex
+	ON render_machine (machine_name);
+
+INSERT INTO render_machine (machine_name) VALUES ('SERVER');
+
+CREATE TABLE frame_task_status
+(
+	id INTEGER NOT NULL,
+	status_name VARCHAR(30) NOT NULL,
+	CONSTRAINT frame_task_status_pk
+		PRIMARY KEY (id)
+);
+
+CREATE UNIQUE INDEX frame_task_status_status_name_uindex
+	ON frame_task_status (status_name);
+
+INSERT INTO frame_task_status (status_name) VALUES
+	('CREATED'), ('RESERVED'), ('FINISHED'), ('CANCELLED'), ('FAILED');
+
+-- current status of every frame, kept in sync with frame_task_history
+CREATE TABLE frame_task
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	change_date DATETIME(6) NOT NULL,
+	machine_id INT NULL,
+	status INT NOT NULL,
+	lease_expires DATETIME(6) NULL,
+	attempts INT NOT NULL DEFAULT 0,
+	retry_after DATETIME(6) NULL,
+	estimated_seconds DOUBLE NULL,
+	claim_priority BIGINT NOT NULL DEFAULT 0,
+	CONSTRAINT frame_task_pk
+		PRIMARY KEY (render_project_id, frame_index),
+	CONSTRAINT frame_task_frame_task_status_id_fk
+		FOREIGN KEY (status) REFERENCES frame_task_status (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_task_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_task_render_project_id_fk
+		FOREIGN KEY (render_project_id) REFERENCES render_project (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE INDEX frame_task_render_project_id_status_frame_index_index
+	ON frame_task (render_project_id, status, frame_index);
+
+CREATE INDEX frame_task_render_project_id_machine_id_status_index
+	ON frame_task (render_project_id, machine_id, status);
+
+-- sample first, then longest first claims of sample first projects
+CREATE INDEX frame_task_render_project_id_status_claim_priority_index
+	ON frame_task (render_project_id, status, claim_priority DESC);
+
+-- border render tiles of the frames of tiled projects, claimed like frames, the frame is stitched once all are in
+CREATE TABLE frame_tile
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	tile_index INT NOT NULL,
+	change_date DATETIME(6) NOT NULL,
+	machine_id INT NULL,
+	status INT NOT NULL,
+	lease_expires DATETIME(6) NULL,
+	CONSTRAINT frame_tile_pk
+		PRIMARY KEY (render_project_id, frame_index, tile_index),
+	CONSTRAINT frame_tile_frame_task_fk
+		FOREIGN KEY (render_project_id, frame_index) REFERENCES frame_task (render_project_id, frame_index)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_tile_frame_task_status_id_fk
+		FOREIGN KEY (status) REFERENCES frame_task_status (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_tile_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE INDEX frame_tile_render_project_id_status_frame_index_index
+	ON frame_tile (render_project_id, status, frame_index);
+
+-- failed render attempts of a frame per machine, frames that keep failing on a machine are left to the others
+CREATE TABLE frame_failure
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	machine_id INT NOT NULL,
+	failures INT NOT NULL,
+	last_failure DATETIME(6) NOT NULL,
+	CONSTRAINT frame_failure_pk
+		PRIMARY KEY (render_project_id, frame_index, machine_id),
+	CONSTRAINT frame_failure_frame_task_fk
+		FOREIGN KEY (render_project_id, frame_index) REFERENCES frame_task (render_project_id, frame_index)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_failure_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE TABLE frame_task_history
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	change_date DATETIME(6) NOT NULL,
+	machine_id INT NULL,
+	status INT NOT NULL,
+	CONSTRAINT frame_task_history_pk
+		PRIMARY KEY (render_project_id, frame_index, change_date),
+	CONSTRAINT frame_task_history_frame_task_status_id_fk
+		FOREIGN KEY (status) REFERENCES frame_task_status (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_task_history_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_task_history_render_project_id_fk
+		FOREIGN KEY (render_project_id) REFERENCES render_project (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE INDEX frame_task_history_render_project_id_change_date_index
+	ON frame_task_history (render_project_id, change_date);
+
+-- summary of the history of finished and cancelled projects, written by compact-history
+CREATE TABLE frame_task_history_archive
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	machine_id INT NULL,
+	status INT NOT NULL,
+	first_change_date DATETIME(6) NOT NULL,
+	last_change_date DATETIME(6) NOT NULL,
+	number_of_changes INT NOT NULL,
+	CONSTRAINT frame_task_history_archive_pk
+		PRIMARY KEY (render_project_id, frame_index),
+	CONSTRAINT frame_task_history_archive_frame_task_status_id_fk
+		FOREIGN KEY (status) REFERENCES frame_task_status (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_task_history_archive_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_task_history_archive_render_project_id_fk
+		FOREIGN KEY (render_project_id) REFERENCES render_project (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+-- render statistics of every frame, parsed from the output of Blender
+CREATE TABLE frame_render_metric
+(
+	render_project_id INT NOT NULL,
+	frame_index INT NOT NULL,
+	machine_id INT NOT NULL,
+	render_date DATETIME(6) NOT NULL,
+	render_seconds DOUBLE NULL,
+	peak_memory_mb DOUBLE NULL,
+	output_path VARCHAR(255) NULL,
+	blender_exit_code INT NULL,
+	CONSTRAINT frame_render_metric_pk
+		PRIMARY KEY (render_project_id, frame_index, machine_id, render_date),
+	CONSTRAINT frame_render_metric_render_machine_id_fk
+		FOREIGN KEY (machine_id) REFERENCES render_machine (id)
+			ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT frame_render_metric_render_project_id_fk
+		FOREIGN KEY (render_project_id) REFERENCES render_project (id)
+			ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+CREATE INDEX frame_render_metric_machine_id_index
+	ON frame_render_metric (machine_id);
+
+-- migrations from database/migrations_sqlite that are part of this schema or have been applied to it
+CREATE TABLE schema_migration
+(
+	version VARCHAR(100) NOT NULL,
+	applied_date DATETIME(6) NOT NULL,
+	CONSTRAINT schema_migration_pk
+		PRIMARY KEY (version)
+);
@@ -0,0 +1,100 @@
+import mysql.connector
+import mysql.connector.errorcode
+import mysql.connector.errors
+import mysql.connector.pooling
+import threading
+import logging
+
+
+SETUP_SCRIPT = 'setup.sql'
+MIGRATIONS = 'migrations'
+
+# errors after which the statement or transaction is retried on a fresh connection
+_TRANSIENT_ERRORS = [
+    mysql.connector.errorcode.CR_CONNECTION_ERROR,
+    mysql.connector.errorcode.CR_CONN_HOST_ERROR,
+    mysql.connector.errorcode.CR_SERVER_GONE_ERROR,
+    mysql.connector.errorcode.CR_SERVER_LOST,
+    mysql.connector.errorcode.CR_SERVER_LOST_EXTENDED,
+    mysql.connector.errorcode.ER_CON_COUNT_ERROR,
+    mysql.connector.errorcode.ER_LOCK_DEADLOCK,
+    mysql.connector.errorcode.ER_LOCK_WAIT_TIMEOUT
+]
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _get_connection_parameters(cfg):
+    return {
+        'host': cfg['database']['host'],
+        'user': cfg['database']['user'],
+        'passwd': cfg['database']['pw'],
+        'port': cfg['database']['port'],
+        'database': cfg['database']['db']
+    }
+
+
+def _get_pool(cfg):
+    parameters = _get_connection_parameters(cfg)
+    key = (parameters['host'], parameters['port'], parameters['user'], parameters['database'])
+
+    with _pool_lock:
+        if key not in _pools:
+            _pools[key] = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name='render_farm_{}'.format(len(_pools)),
+                pool_size=int(cfg['database']['pool_size']),
+                **parameters)
+
+        return _pools[key]
+
+
+def is_transient_error(e):
+    return isinstance(e, mysql.connector.errors.Error) and e.errno in _TRANSIENT_ERRORS
+
+
+def connect(cfg):
+    try:
+        db = _get_pool(cfg).get_connection()
+    except mysql.connector.errors.PoolError:
+        logging.debug('The connection pool is exhausted, opening a dedicated connection.')
+        db = mysql.connector.connect(**_get_connection_parameters(cfg))
+
+    # health check, a connection that went stale in the pool is re-established here
+    db.ping(reconnect=True)
+
+    return db, db.cursor(buffered=False)
+
+
+def reconnect(db):
+    db.reconnect()
+
+
+def translate(sql):
+    return sql
+
+
+def begin(db):
+    # a transaction is started implicitly by the first statement, autocommit is off
+    pass
+
+
+def execute(cursor, sql, params, multi=False):
+    return cursor.execute(sql, params, multi=multi)
+
+
+def execute_script(db, cursor, script):
+    # the results of a multi statement have to be consumed, otherwise only the first statement is run
+    for _ in cursor.execute(script, multi=True):
+        pass
+
+
+def drop_tables(cfg, db, cursor):
+    cursor.execute('USE {};'.format(cfg['database']['db']))
+    cursor.execute('SHOW TABLES;')
+    tables = [table[0].decode('utf-8') if isinstance(table[0], bytes) else table[0] for table in cursor]
+
+    cursor.execute('SET FOREIGN_KEY_CHECKS = 0;')
+    for table in tables:
+        cursor.execute('DROP TABLE {};'.format(table))
+    cursor.execute('SET FOREIGN_KEY_CHECKS = 1;')
@@ -0,0 +1,130 @@
+import sqlite3
+import functools
+import datetime as dt
+import re
+import os
+
+
+SETUP_SCRIPT = 'setup_sqlite.sql'
+MIGRATIONS = 'migrations_sqlite'
+
+_BUSY_TIMEOUT = 30
+_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# the queries are written for MySQL, these rewrites cover the syntax SQLite does not understand
+_TRANSLATIONS = [
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'INTERVAL\s+(\S+)\s+SECOND'), r'\1'),
+    (re.compile(r'\s+FOR UPDATE( SKIP LOCKED)?'), ''),
+    (re.compile(r'INSERT IGNORE'), 'INSERT OR IGNORE'),
+    (re.compile(r'\bLEAST\('), 'MIN('),
+    (re.compile(r'\bGREATEST\('), 'MAX('),
+    (re.compile(r'ON DUPLICATE KEY UPDATE'), 'ON CONFLICT DO UPDATE SET'),
+    (re.compile(r'\bVALUES\((\w+)\)'), r'excluded.\1')
+]
+
+
+def format_datetime(value):
+    # all dates are stored as UTC text with microseconds, so they compare correctly as strings
+    if value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+
+    return value.strftime(_DATETIME_FORMAT)
+
+
+def parse_datetime(value):
+    # fromisoformat reads both formats and is much faster than strptime, which matters for long frame lists
+    text = value.decode('utf-8') if isinstance(value, bytes) else value
+
+    try:
+        return dt.datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+sqlite3.register_adapter(dt.datetime, format_datetime)
+sqlite3.register_converter('DATETIME', parse_datetime)
+
+
+def utc_timestamp(precision=0):
+    return format_datetime(dt.datetime.now(tz=dt.timezone.utc))
+
+
+def date_add(value, seconds):
+    # like DATE_ADD(..., INTERVAL n SECOND) in MySQL, NULL if either argument is NULL
+    if value is None or seconds is None:
+        return None
+
+    return format_datetime(parse_datetime(value) + dt.timedelta(seconds=float(seconds)))
+
+
+def modulo(value, divisor):
+    if value is None or not divisor:
+        return None
+
+    return value % divisor
+
+
+def is_transient_error(e):
+    # concurrent writers wait for the busy timeout first, the whole unit of work is retried afterwards
+    return isinstance(e, sqlite3.OperationalError) and ('locked' in str(e) or 'busy' in str(e))
+
+
+def connect(cfg):
+    path = cfg['database']['sqlite_path']
+    if path != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # transactions are started explicitly, see begin
+    db = sqlite3.connect(path, timeout=_BUSY_TIMEOUT, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES)
+
+    db.create_function('UTC_TIMESTAMP', 0, utc_timestamp)
+    db.create_function('UTC_TIMESTAMP', 1, utc_timestamp)
+    db.create_function('DATE_ADD', 2, date_add)
+    db.create_function('MOD', 2, modulo)
+
+    # WAL lets the readers go on while a worker writes, the foreign keys carry the cascading deletes
+    db.execute('PRAGMA journal_mode = WAL;')
+    db.execute('PRAGMA synchronous = NORMAL;')
+    db.execute('PRAGMA foreign_keys = ON;')
+
+    return db, db.cursor()
+
+
+def reconnect(db):
+    pass
+
+
+@functools.lru_cache(maxsize=256)
+def translate(sql):
+    for pattern, replacement in _TRANSLATIONS:
+        sql = pattern.sub(replacement, sql)
+
+    return sql
+
+
+def begin(db):
+    # takes the write lock up front, so two workers claiming frames are serialized instead of
+    # failing when both try to upgrade their read lock
+    db.execute('BEGIN IMMEDIATE;')
+
+
+def execute(cursor, sql, params, multi=False):
+    if multi:
+        return cursor.executescript(sql)
+
+    return cursor.execute(sql, params)
+
+
+def execute_script(db, cursor, script):
+    cursor.executescript(script)
+
+
+def drop_tables(cfg, db, cursor):
+    tables = [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%';").fetchall()]
+
+    cursor.execute('PRAGMA foreign_keys = OFF;')
+    for table in tables:
+        cursor.execute('DROP TABLE {};'.format(table))
+    cursor.execute('PRAGMA foreign_keys = ON;')
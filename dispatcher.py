@@ -0,0 +1,480 @@
+import database
+import frame_range
+import project
+import concurrent.futures
+import contextlib
+import datetime as dt
+import threading
+import asyncio
+import bisect
+import socket
+import signal
+import json
+import time
+import logging
+
+
+# open frames looked at per claim, out of which the most contiguous batch is picked, like the claims in the database
+_CLAIM_CANDIDATE_FACTOR = 2
+
+# connection of each worker thread to the dispatcher, opened on first use
+_connections = threading.local()
+
+
+def parse_address(address):
+    # "unix:/path/to/socket" or "host:port"
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or 'localhost', int(port))
+
+
+def is_enabled(cfg):
+    return cfg['dispatcher']['address'] != ''
+
+
+def get_connection(cfg):
+    if getattr(_connections, 'socket', None) is None:
+        family, address = parse_address(cfg['dispatcher']['address'])
+
+        if family == socket.AF_UNIX:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.connect(address)
+        else:
+            connection = socket.create_connection(address)
+
+        _connections.socket = connection
+        _connections.file = connection.makefile('rb')
+
+    return _connections.socket, _connections.file
+
+
+def close_connection():
+    if getattr(_connections, 'socket', None) is not None:
+        _connections.file.close()
+        _connections.socket.close()
+
+    _connections.socket = None
+    _connections.file = None
+
+
+def request(cfg, op, **fields):
+    # one JSON object per line in both directions, a broken connection is reopened once
+    message = (json.dumps(dict(fields, op=op)) + '\n').encode('utf8')
+
+    for attempt in range(2):
+        try:
+            connection, connection_file = get_connection(cfg)
+            connection.sendall(message)
+
+            line = connection_file.readline()
+            if not line:
+                raise ConnectionError('the dispatcher closed the connection')
+
+            response = json.loads(line)
+            break
+        except (OSError, ValueError) as e:
+            close_connection()
+
+            if attempt == 1:
+                logging.error('The dispatcher at "{}" could not be reached: {}'.format(cfg['dispatcher']['address'], e))
+                return None
+
+    if 'error' in response:
+        logging.error('The dispatcher could not handle the {} request: {}'.format(op, response['error']))
+        return None
+
+    return response
+
+
+def claim(cfg, project_id, number_of_frames):
+    response = request(cfg, 'claim', project_id=project_id, machine=cfg['general']['machine_name'],
+                       count=number_of_frames)
+    return response['frames'] if response is not None else None
+
+
+def complete(cfg, project_id, frames):
+    return request(cfg, 'complete', project_id=project_id, machine=cfg['general']['machine_name'],
+                   frames=frames) is not None
+
+
+def fail(cfg, project_id, frames):
+    response = request(cfg, 'fail', project_id=project_id, machine=cfg['general']['machine_name'], frames=frames)
+    return {'retried': response['retried'], 'failed': response['failed']} if response is not None else None
+
+
+def release(cfg, project_id, frames):
+    return request(cfg, 'release', project_id=project_id, machine=cfg['general']['machine_name'],
+                   frames=frames) is not None
+
+
+def renew(cfg, project_id, frames):
+    return request(cfg, 'renew', project_id=project_id, machine=cfg['general']['machine_name'],
+                   frames=frames) is not None
+
+
+def count_open(cfg, project_id):
+    response = request(cfg, 'open', project_id=project_id, machine=cfg['general']['machine_name'])
+    return response['frames'] if response is not None else None
+
+
+def get_seconds_until(date):
+    # dates of the database are naive UTC
+    if date is None:
+        return None
+
+    return (date - dt.datetime.now(tz=dt.timezone.utc).replace(tzinfo=None)).total_seconds()
+
+
+def load_project_state(cfg, db, cursor, project_id, previous=None):
+    # the open and reserved frames of a project, reservations already known keep their lease
+    created_id = project.get_frame_status_id(db, cursor, 'CREATED')
+    reserved_id = project.get_frame_status_id(db, cursor, 'RESERVED')
+    now = time.monotonic()
+
+    state = {'open': [], 'reserved': {}, 'retry_after': {}, 'excluded': {}}
+
+    result = database.execute_statement(db, cursor, '''
+    SELECT frame_index, status, machine_id, lease_expires, retry_after FROM frame_task
+        WHERE render_project_id = %s AND status IN (%s, %s)
+        ORDER BY frame_index;
+    ''', (project_id, created_id, reserved_id), with_result=True)
+
+    for frame, status, machine_id, lease_expires, retry_after in result:
+        if status == created_id:
+            state['open'].append(frame)
+        elif previous is not None and previous['reserved'].get(frame, [None])[0] == machine_id:
+            state['reserved'][frame] = previous['reserved'][frame]
+        else:
+            state['reserved'][frame] = [machine_id, now + (get_seconds_until(lease_expires) or 0)]
+
+        if retry_after is not None:
+            state['retry_after'][frame] = now + get_seconds_until(retry_after)
+
+    result = database.execute_statement(db, cursor, '''
+    SELECT frame_index, machine_id FROM frame_failure WHERE render_project_id = %s AND failures >= %s;
+    ''', (project_id, int(cfg['retry']['failures_per_machine'])), with_result=True)
+
+    for frame, machine_id in result:
+        state['excluded'].setdefault(frame, set()).add(machine_id)
+
+    return state
+
+
+def is_claimable(state, frame, machine_id, now):
+    return state['retry_after'].get(frame, now) <= now and machine_id not in state['excluded'].get(frame, ())
+
+
+def claim_frames(state, machine_id, number_of_frames, lease_seconds):
+    # the same order as the claims against the database, expired reservations first, then the most
+    # contiguous run out of the first open frames
+    now = time.monotonic()
+
+    expired_frames = sorted(frame for frame, (_, deadline) in state['reserved'].items()
+                            if deadline < now and is_claimable(state, frame, machine_id, now))[:number_of_frames]
+
+    candidates = []
+    missing_frames = number_of_frames - len(expired_frames)
+    for frame in state['open']:
+        if len(candidates) >= missing_frames * _CLAIM_CANDIDATE_FACTOR:
+            break
+
+        if is_claimable(state, frame, machine_id, now):
+            candidates.append(frame)
+
+    open_frames = frame_range.pick_contiguous(candidates, missing_frames) if missing_frames > 0 else []
+    for frame in open_frames:
+        del state['open'][bisect.bisect_left(state['open'], frame)]
+
+    frames = sorted(expired_frames + open_frames)
+    for frame in frames:
+        state['reserved'][frame] = [machine_id, now + lease_seconds]
+
+    return frames
+
+
+def count_open_frames(state, machine_id):
+    now = time.monotonic()
+
+    return (sum(1 for frame in state['open'] if is_claimable(state, frame, machine_id, now))
+            + sum(1 for frame, (_, deadline) in state['reserved'].items()
+                  if deadline < now and is_claimable(state, frame, machine_id, now)))
+
+
+def get_pending_condition(db, cursor, machine_id, status):
+    # the database may have moved on since the state was loaded, e.g. by a cancel, so claims only take frames
+    # that are still open or whose lease ran out, and completions, releases and renewals only frames the machine
+    # still holds
+    created_id = project.get_frame_status_id(db, cursor, 'CREATED')
+    reserved_id = project.get_frame_status_id(db, cursor, 'RESERVED')
+
+    if status == 'RESERVED':
+        return '(status = %s OR (status = %s AND lease_expires < UTC_TIMESTAMP(6)))', (created_id, reserved_id)
+
+    return 'machine_id = %s AND status = %s', (machine_id, reserved_id)
+
+
+def write_pending(cfg, db, cursor, pending):
+    # returns the projects with changes the database rejected, their state is stale
+    stale_projects = set()
+
+    for project_id, frames, now, machine_id, status in pending:
+        status_condition, status_params = get_pending_condition(db, cursor, machine_id, status)
+        changed = 0
+
+        for ranges in database.chunked(frame_range.to_ranges(frames)):
+            condition, condition_params = frame_range.get_range_condition('frame_index', ranges)
+            condition = '{} AND {}'.format(condition, status_condition)
+
+            if status == 'LEASE':
+                # lease renewals, the database follows the dispatcher so a restart picks the leases up again
+                database.execute_statement(db, cursor, '''
+                UPDATE frame_task SET lease_expires = DATE_ADD(UTC_TIMESTAMP(6), INTERVAL %s SECOND)
+                    WHERE render_project_id = %s AND {};
+                '''.format(condition), (cfg['render']['lease_seconds'], project_id) + condition_params
+                                           + status_params)
+                changed += cursor.rowcount
+            else:
+                lease_seconds = cfg['render']['lease_seconds'] if status == 'RESERVED' else None
+                changed += project.write_frame_task_status_where(
+                    db, cursor, project_id, now, machine_id, project.get_frame_status_id(db, cursor, status),
+                    condition, condition_params + status_params, lease_seconds)
+
+        if changed < len(frames):
+            logging.warning('{} of {} {} change(s) of project {} were rejected by the database.'.format(
+                len(frames) - changed, len(frames), status, project_id))
+            stale_projects.add(project_id)
+
+    return stale_projects
+
+
+class Dispatcher:
+    # holds the open and reserved frames of the projects being rendered, all changes are written back to the
+    # database in batches, the database stays the source of truth and is re-read on a restart and periodically
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.projects = {}
+        self.pending = []
+        self.lock = asyncio.Lock()
+
+        # all database access happens on one thread with its own connection
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='dispatcher-db')
+        self.db = None
+        self.cursor = None
+
+    async def run_db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def connect(self):
+        self.db, self.cursor = await self.run_db(database.connect_to_database, self.cfg)
+        return self.db is not None
+
+    def get_machine_id(self, name):
+        return project.get_machine_id(self.db, self.cursor, name)
+
+    def load_project_state(self, project_id, previous=None):
+        # the read transaction of the last statement is ended first, with autocommit off MySQL would
+        # otherwise keep answering from the snapshot it took back then
+        database.rollback(self.db)
+        return load_project_state(self.cfg, self.db, self.cursor, project_id, previous)
+
+    async def get_project(self, project_id):
+        if project_id not in self.projects:
+            self.projects[project_id] = await self.run_db(self.load_project_state, project_id)
+            logging.info('Loaded project {} with {} open and {} reserved frame(s).'.format(
+                project_id, len(self.projects[project_id]['open']), len(self.projects[project_id]['reserved'])))
+
+        return self.projects[project_id]
+
+    def queue_status(self, project_id, frames, machine_id, status):
+        # LEASE stands for a renewal of the leases, it is not a frame status
+        if len(frames) > 0:
+            self.pending.append((project_id, frames, dt.datetime.now(tz=dt.timezone.utc), machine_id, status))
+
+    async def flush(self):
+        # called with the lock held, a failed flush is kept and written with the next one
+        if len(self.pending) == 0:
+            return True
+
+        pending, self.pending = self.pending, []
+        stale_projects = await self.run_db(database.run_in_transaction, self.db, self.cursor, write_pending,
+                                           self.cfg, self.db, self.cursor, pending)
+        if stale_projects is None:
+            self.pending = pending + self.pending
+            logging.error('{} pending change(s) could not be written, retrying with the next flush.'.format(
+                len(pending)))
+            return False
+
+        logging.debug('Wrote {} pending change(s) to the database.'.format(len(pending)))
+
+        # rejected frames are dropped by reloading the projects, the database is right about them
+        for project_id in stale_projects:
+            if project_id in self.projects:
+                await self.reload_project(project_id)
+
+        return True
+
+    async def refresh(self):
+        # picks up what was changed besides the dispatcher, e.g. cancelled or freed frames
+        for project_id in list(self.projects):
+            await self.reload_project(project_id)
+
+    async def reload_project(self, project_id):
+        state = await self.run_db(self.load_project_state, project_id, self.projects[project_id])
+
+        if len(state['open']) == 0 and len(state['reserved']) == 0:
+            del self.projects[project_id]
+        else:
+            self.projects[project_id] = state
+
+    async def flush_loop(self):
+        flush_interval = float(self.cfg['dispatcher']['flush_interval'])
+        refresh_interval = float(self.cfg['dispatcher']['refresh_interval'])
+        last_refresh = time.monotonic()
+
+        while True:
+            await asyncio.sleep(flush_interval)
+
+            async with self.lock:
+                if await self.flush() and time.monotonic() - last_refresh >= refresh_interval:
+                    await self.refresh()
+                    last_refresh = time.monotonic()
+
+    async def handle_request(self, message):
+        op = message['op']
+        project_id = int(message['project_id'])
+        machine_id = await self.run_db(self.get_machine_id, message['machine'])
+        if machine_id is None:
+            raise ValueError('machine "{}" is not registered'.format(message['machine']))
+
+        async with self.lock:
+            state = await self.get_project(project_id)
+
+            if op == 'claim':
+                frames = claim_frames(state, machine_id, int(message['count']),
+                                      float(self.cfg['render']['lease_seconds']))
+                self.queue_status(project_id, frames, machine_id, 'RESERVED')
+                return {'frames': frames}
+
+            elif op == 'complete':
+                frames = [int(frame) for frame in message['frames']]
+                for frame in frames:
+                    state['reserved'].pop(frame, None)
+
+                    index = bisect.bisect_left(state['open'], frame)
+                    if index < len(state['open']) and state['open'][index] == frame:
+                        del state['open'][index]
+
+                self.queue_status(project_id, frames, machine_id, 'FINISHED')
+                return {}
+
+            elif op == 'fail':
+                # the retry decision needs the attempts of the frames, so failures are written through
+                frames = [int(frame) for frame in message['frames']]
+                await self.flush()
+
+                failures = await self.run_db(database.run_in_transaction, self.db, self.cursor,
+                                             project.write_frame_failures, self.cfg, self.db, self.cursor,
+                                             project_id, machine_id, frames)
+                self.projects[project_id] = await self.run_db(self.load_project_state, project_id, state)
+
+                # the worker writes the failures itself then
+                if failures is None:
+                    raise ValueError('the failures could not be written')
+
+                return failures
+
+            elif op == 'release':
+                # frames claimed but not rendered are open again right away
+                frames = [int(frame) for frame in message['frames'] if state['reserved'].get(int(frame), [None])[0]
+                          == machine_id]
+
+                for frame in frames:
+                    del state['reserved'][frame]
+                    bisect.insort(state['open'], frame)
+
+                self.queue_status(project_id, frames, machine_id, 'CREATED')
+                return {}
+
+            elif op == 'renew':
+                deadline = time.monotonic() + float(self.cfg['render']['lease_seconds'])
+                frames = [int(frame) for frame in message['frames'] if state['reserved'].get(int(frame), [None])[0]
+                          == machine_id]
+
+                for frame in frames:
+                    state['reserved'][frame][1] = deadline
+
+                self.queue_status(project_id, frames, machine_id, 'LEASE')
+                return {}
+
+            elif op == 'open':
+                return {'frames': count_open_frames(state, machine_id)}
+
+        raise ValueError('unknown operation "{}"'.format(op))
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    response = await self.handle_request(json.loads(line))
+                except Exception as e:
+                    logging.error('The dispatcher request {} failed: {}'.format(line.strip(), e))
+                    response = {'error': str(e)}
+
+                writer.write((json.dumps(response) + '\n').encode('utf8'))
+                await writer.drain()
+        except (asyncio.CancelledError, ConnectionError):
+            # the connections of the workers are dropped on shutdown, they reconnect to the next dispatcher
+            pass
+        finally:
+            writer.close()
+
+    async def run(self):
+        if not await self.connect():
+            return
+
+        family, address = parse_address(self.cfg['dispatcher']['address'])
+        if family == socket.AF_UNIX:
+            server = await asyncio.start_unix_server(self.handle_connection, path=address)
+        else:
+            server = await asyncio.start_server(self.handle_connection, *address)
+
+        logging.info('Dispatcher listening on "{}".'.format(self.cfg['dispatcher']['address']))
+
+        # a service manager stops the dispatcher with SIGTERM, the pending changes are written before it exits
+        stop = asyncio.Event()
+        for signal_number in [signal.SIGINT, signal.SIGTERM]:
+            with contextlib.suppress(NotImplementedError):
+                asyncio.get_running_loop().add_signal_handler(signal_number, stop.set)
+
+        flusher = asyncio.ensure_future(self.flush_loop())
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            flusher.cancel()
+
+            # nothing that was confirmed to a worker is lost on shutdown
+            async with self.lock:
+                await self.flush()
+
+            await self.run_db(database.close_connection, self.db, self.cursor)
+            self.executor.shutdown()
+
+
+def serve(cfg):
+    if not is_enabled(cfg):
+        logging.error('No dispatcher address is configured, set dispatcher.address in the config.')
+        return
+
+    try:
+        asyncio.run(Dispatcher(cfg).run())
+    except KeyboardInterrupt:
+        pass
+
+    logging.info('Dispatcher stopped.')
@@ -1,8 +1,21 @@
 import dropbox
 import dropbox.exceptions
 import dropbox.files
+import requests.exceptions
+import metrics
+import concurrent.futures
+import threading
+import time
 import logging
 import ntpath
+import os
+
+
+_MAX_BATCH_ENTRIES = 1000
+_BATCH_CHECK_INTERVAL = 0.5
+
+_clients = {}
+_clients_lock = threading.Lock()
 
 
 def get_base_filename(path):
@@ -10,20 +23,122 @@ def get_base_filename(path):
     return tail or ntpath.basename(head)
 
 
-def upload_file(token, file, app_name):
-    upload_files(token, [file], app_name)
+def get_client(token):
+    # one client per token and process, so its HTTP session and connections are reused
+    with _clients_lock:
+        if token not in _clients:
+            _clients[token] = dropbox.Dropbox(token)
+
+        return _clients[token]
+
+
+def upload_file(token, file, app_name, project_name, **kwargs):
+    return upload_files(token, [file], app_name, project_name, **kwargs)
+
+
+def stream_file(dbx, file, chunk_size):
+    # the file is read chunk by chunk, the session is closed with the last chunk so it can be committed in a batch
+    size = os.path.getsize(file)
+
+    with open(file, 'rb') as f:
+        chunk = f.read(chunk_size)
+        session = dbx.files_upload_session_start(chunk, close=len(chunk) >= size)
+        cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=len(chunk))
+
+        while cursor.offset < size:
+            chunk = f.read(chunk_size)
+            dbx.files_upload_session_append_v2(chunk, cursor, close=cursor.offset + len(chunk) >= size)
+            cursor.offset += len(chunk)
+
+    return cursor
+
+
+def finish_batch(dbx, entries):
+    launch = dbx.files_upload_session_finish_batch(entries)
+
+    if launch.is_complete():
+        result = launch.get_complete()
+    else:
+        job_id = launch.get_async_job_id()
+        status = dbx.files_upload_session_finish_batch_check(job_id)
+
+        while status.is_in_progress():
+            time.sleep(_BATCH_CHECK_INTERVAL)
+            status = dbx.files_upload_session_finish_batch_check(job_id)
+
+        result = status.get_complete()
+
+    failures = [entry.get_failure() for entry in result.entries if entry.is_failure()]
+    for failure in failures:
+        logging.critical('Dropbox could not commit an uploaded file: ' + str(failure))
+
+    return len(failures) == 0
+
 
+def upload_files(token, files, app_name, project_name, chunk_size_mb=8, parallel_uploads=4):
+    with metrics.timer('upload_seconds'):
+        success = transfer_files(token, files, app_name, project_name, chunk_size_mb, parallel_uploads)
 
-def upload_files(token, files, app_name, project_name):
+    if success:
+        metrics.inc('upload_bytes_total', sum(os.path.getsize(file) for file in files))
+
+    return success
+
+
+def transfer_files(token, files, app_name, project_name, chunk_size_mb, parallel_uploads):
     try:
-        dbx = dropbox.Dropbox(token)
+        dbx = get_client(token)
+        chunk_size = int(chunk_size_mb * 1024 * 1024)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(parallel_uploads))) as executor:
+            cursors = list(executor.map(lambda file: stream_file(dbx, file, chunk_size), files))
+
+        entries = [dropbox.files.UploadSessionFinishArg(
+            cursor=cursor,
+            commit=dropbox.files.CommitInfo(
+                path='/' + app_name + '/' + project_name + '/' + get_base_filename(file),
+                mode=dropbox.files.WriteMode.overwrite))
+            for file, cursor in zip(files, cursors)]
+
+        success = True
+        for start in range(0, len(entries), _MAX_BATCH_ENTRIES):
+            success = finish_batch(dbx, entries[start:start + _MAX_BATCH_ENTRIES]) and success
+
+        return success
+    except dropbox.exceptions.ApiError as e:
+        logging.critical('Dropbox produced an API error: ' + str(e))
+        return False
+    except dropbox.exceptions.DropboxException as e:
+        logging.critical('Dropbox produced an error: ' + str(e))
+        return False
+    except requests.exceptions.RequestException as e:
+        # the connection errors of requests are IOErrors as well, so they are told apart first
+        logging.critical('Dropbox could not be reached: ' + str(e))
+        return False
+    except IOError as e:
+        logging.critical('A rendered file could not be read for the upload: ' + str(e))
+        return False
+
+
+def download_files(token, files, app_name, project_name):
+    # the counterpart of upload_files, every file is fetched from the project folder into the given local path
+    try:
+        dbx = get_client(token)
 
         for file in files:
-            with open(file, 'rb') as f:
-                dbx.files_upload(f.read(), '/' + app_name + '/' + project_name + '/' + get_base_filename(file),
-                                 dropbox.files.WriteMode.overwrite)
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            dbx.files_download_to_file(file, '/' + app_name + '/' + project_name + '/' + get_base_filename(file))
 
         return True
     except dropbox.exceptions.ApiError as e:
         logging.critical('Dropbox produced an API error: ' + str(e))
         return False
+    except dropbox.exceptions.DropboxException as e:
+        logging.critical('Dropbox produced an error: ' + str(e))
+        return False
+    except requests.exceptions.RequestException as e:
+        logging.critical('Dropbox could not be reached: ' + str(e))
+        return False
+    except IOError as e:
+        logging.critical('A downloaded file could not be written: ' + str(e))
+        return False
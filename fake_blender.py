@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# stands in for Blender in the benchmarks: fake_blender.py -b <file> -o <pattern> [-t N] (-s S -e E -a | -f F)...
+# every frame sleeps FAKE_BLENDER_SECONDS and writes a stub PNG, the output looks like the one of Blender
+import sys
+import time
+import os
+import re
+
+
+# a valid 1x1 pixel PNG
+_STUB_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489'
+    '0000000b49444154789c6360000200000500017a5eab3f0000000049454e44ae426082')
+
+
+def get_output_path(pattern, frame):
+    # Blender replaces the run of # with the zero padded frame number, or appends four digits
+    if '#' in pattern:
+        path = re.sub('#+', lambda m: str(frame).zfill(len(m.group(0))), pattern, count=1)
+    else:
+        path = pattern + str(frame).zfill(4)
+
+    return path + '.png'
+
+
+def render_frame(pattern, frame, seconds):
+    start_time = time.time()
+    print('Fra:{} Mem:10.00M (Peak 12.00M) | Time:00:00.00 | Rendering'.format(frame))
+
+    time.sleep(seconds)
+
+    path = get_output_path(pattern, frame)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(_STUB_PNG)
+
+    print("Saved: '{}'".format(path))
+    print(' Time: 00:{:05.2f} (Saving: 00:00.00)'.format(time.time() - start_time))
+
+
+def main():
+    seconds = float(os.environ.get('FAKE_BLENDER_SECONDS', '0.05'))
+    argv = sys.argv[1:]
+    pattern = '//render_'
+    start = end = 1
+
+    # the arguments are processed in order like Blender does, -a renders the range set so far
+    i = 0
+    while i < len(argv):
+        if argv[i] == '-o':
+            pattern = argv[i + 1]
+            i += 1
+        elif argv[i] == '-s':
+            start = int(argv[i + 1])
+            i += 1
+        elif argv[i] == '-e':
+            end = int(argv[i + 1])
+            i += 1
+        elif argv[i] == '-a':
+            for frame in range(start, end + 1):
+                render_frame(pattern, frame, seconds)
+        elif argv[i] == '-f':
+            render_frame(pattern, int(argv[i + 1]), seconds)
+            i += 1
+        elif argv[i] in ['-b', '-t', '--python-expr']:
+            i += 1
+
+        i += 1
+
+    sys.stdout.flush()
+
+
+main()
@@ -0,0 +1,92 @@
+def to_ranges(frames):
+    # run-length encodes the frames into sorted, inclusive (start, end) pairs
+    ranges = []
+
+    for frame in sorted(set(frames)):
+        if len(ranges) > 0 and ranges[-1][1] == frame - 1:
+            ranges[-1] = (ranges[-1][0], frame)
+        else:
+            ranges.append((frame, frame))
+
+    return ranges
+
+
+def from_ranges(ranges):
+    return [frame for start, end in ranges for frame in range(start, end + 1)]
+
+
+def count_frames(ranges):
+    return sum(end - start + 1 for start, end in ranges)
+
+
+def format_ranges(frames):
+    return ', '.join(str(start) if start == end else '{}-{}'.format(start, end) for start, end in to_ranges(frames))
+
+
+def merge_ranges(ranges):
+    # sorts the (start, end) pairs and joins the ones that overlap or touch, without expanding them into frames
+    merged = []
+
+    for start, end in sorted(ranges):
+        if len(merged) > 0 and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def parse_ranges(text):
+    # the inverse of format_ranges, e.g. "0-4, 7, 10-12", raises a ValueError for anything else
+    ranges = []
+
+    for part in text.split(','):
+        part = part.strip()
+        if part == '':
+            continue
+
+        start, _, end = part.partition('-')
+        start = int(start)
+        end = int(end) if end != '' else start
+
+        if start < 0 or end < start:
+            raise ValueError('"{}" is not a valid frame range'.format(part))
+
+        ranges.append((start, end))
+
+    if len(ranges) == 0:
+        raise ValueError('no frame range given')
+
+    return merge_ranges(ranges)
+
+
+def is_range_text_valid(text):
+    try:
+        parse_ranges(text)
+    except ValueError:
+        return False
+
+    return True
+
+
+def pick_contiguous(frames, number_of_frames):
+    # prefers the first run that fills the whole batch, otherwise the longest runs are combined
+    ranges = to_ranges(frames)
+
+    for start, end in ranges:
+        if end - start + 1 >= number_of_frames:
+            return list(range(start, start + number_of_frames))
+
+    picked = []
+    for start, end in sorted(ranges, key=lambda r: r[0] - r[1]):
+        picked += list(range(start, end + 1))[:number_of_frames - len(picked)]
+        if len(picked) == number_of_frames:
+            break
+
+    return sorted(picked)
+
+
+def get_range_condition(column, ranges):
+    # SQL condition selecting the frames of the ranges, with the parameters for it
+    condition = ' OR '.join('{} BETWEEN %s AND %s'.format(column) for _ in ranges)
+    return '(' + condition + ')', tuple(value for r in ranges for value in r)
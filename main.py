@@ -17,9 +17,12 @@ def info():
 
 
 def main():
-    info()
-
     args = commandline.parse_parameters()
+
+    # keep stdout machine-readable for JSON output and streamed frame lists
+    if not args.json and not (args.frame_list and args.list_format in ['csv', 'json']):
+        info()
+
     if args.version:
         print('Version: {}'.format(_VERSION))
     else:
@@ -0,0 +1,189 @@
+import http.server
+import contextlib
+import threading
+import time
+import os
+import logging
+
+
+_PREFIX = 'render_farm_'
+_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600]
+
+_METRICS = {
+    'frames_rendered_total': ('counter', 'Frames rendered by Blender.'),
+    'frames_failed_total': ('counter', 'Frames that failed to render or upload.'),
+    'frames_claimed_total': ('counter', 'Frames claimed for rendering.'),
+    'claim_seconds': ('histogram', 'Time to claim a batch of frames.'),
+    'render_seconds': ('histogram', 'Time Blender took for a batch of frames.'),
+    'blender_exit_total': ('counter', 'Blender runs by exit code.'),
+    'upload_bytes_total': ('counter', 'Bytes uploaded to Dropbox.'),
+    'upload_seconds': ('histogram', 'Time to upload a batch of frames.'),
+    'db_statement_seconds': ('histogram', 'Round trip time of a database statement.'),
+    'frames': ('gauge', 'Frames of the open projects by status.')
+}
+
+# counters and gauges hold a number, histograms the bucket counts followed by the sum and the count
+_values = {}
+_lock = threading.Lock()
+_collectors = []
+_default_labels = {}
+
+
+def get_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = get_key(name, labels)
+
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _values[get_key(name, labels)] = value
+
+
+def clear(name):
+    with _lock:
+        for key in [key for key in _values if key[0] == name]:
+            del _values[key]
+
+
+def observe(name, value, **labels):
+    key = get_key(name, labels)
+
+    with _lock:
+        if key not in _values:
+            _values[key] = [0] * (len(_BUCKETS) + 2)
+
+        histogram = _values[key]
+        for i, bound in enumerate(_BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+                break
+
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start_time, **labels)
+
+
+def register_collector(collector):
+    # collectors are called before every export, e.g. to read the queue depth from the database
+    _collectors.append(collector)
+
+
+def format_labels(labels, extra=()):
+    labels = list(_default_labels.items()) + list(labels) + list(extra)
+    if len(labels) == 0:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+
+def format_metrics():
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            logging.error('Collecting metrics failed: ' + str(e))
+
+    with _lock:
+        values = {key: list(value) if isinstance(value, list) else value for key, value in _values.items()}
+
+    lines = []
+    for name, (kind, description) in _METRICS.items():
+        series = sorted((key[1], value) for key, value in values.items() if key[0] == name)
+        if len(series) == 0:
+            continue
+
+        lines.append('# HELP {}{} {}'.format(_PREFIX, name, description))
+        lines.append('# TYPE {}{} {}'.format(_PREFIX, name, kind))
+
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append('{}{}{} {}'.format(_PREFIX, name, format_labels(labels), value))
+                continue
+
+            cumulative = 0
+            for bound, count in zip(_BUCKETS + ['+Inf'], value[:-2] + [value[-1] - sum(value[:-2])]):
+                cumulative += count
+                lines.append('{}{}_bucket{} {}'.format(_PREFIX, name, format_labels(labels, [('le', bound)]),
+                                                       cumulative))
+            lines.append('{}{}_sum{} {}'.format(_PREFIX, name, format_labels(labels), value[-2]))
+            lines.append('{}{}_count{} {}'.format(_PREFIX, name, format_labels(labels), value[-1]))
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path):
+    # replaced atomically, so the node exporter never reads a partial file
+    with open(path + '.tmp', 'w', encoding='utf8') as f:
+        f.write(format_metrics())
+
+    os.replace(path + '.tmp', path)
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = format_metrics().encode('utf8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug('Metrics request: ' + format % args)
+
+
+def textfile_loop(path, interval, stop):
+    while not stop.wait(interval):
+        try:
+            write_textfile(path)
+        except IOError as e:
+            logging.error('The metrics could not be written to "{}": {}'.format(path, e))
+
+
+@contextlib.contextmanager
+def serve(cfg, port=None):
+    # exports the metrics of this process over HTTP and/or into a textfile while the block runs
+    port = int(cfg['metrics']['port'] if port is None else port)
+    path = cfg['metrics']['textfile']
+    _default_labels['machine'] = cfg['general']['machine_name']
+
+    server = None
+    if port > 0:
+        server = http.server.ThreadingHTTPServer(('', port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+
+        logging.info('Serving metrics on port {}.'.format(server.server_address[1]))
+
+    stop = threading.Event()
+    writer = None
+    if path != '':
+        writer = threading.Thread(target=textfile_loop, args=(path, float(cfg['metrics']['interval']), stop),
+                                  name='metrics-textfile', daemon=True)
+        writer.start()
+
+    try:
+        yield
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+        if writer is not None:
+            stop.set()
+            writer.join()
+            write_textfile(path)
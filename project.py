@@ -1,7 +1,16 @@
 import database
-import subprocess
+import dispatcher
+import frame_range
+import metrics
+import asset_cache
+import blender
+import tiles
+import threading
 import os
 import time
+import json
+import csv
+import sys
 import logging
 from prettytable import PrettyTable
 import datetime as dt
@@ -11,6 +20,75 @@ import dropbox_upload
 _VALID_PROJECT_STATUS = ['CREATED', 'RUNNING', 'FINISHED', 'CANCELLED']
 _VALID_FRAME_STATUS = ['CREATED', 'RESERVED', 'FINISHED', 'CANCELLED', 'FAILED']
 
+_RANGES_PER_STATEMENT = 500
+# interpolated segments written per statement when estimating the render time of the frames
+_SEGMENTS_PER_STATEMENT = 200
+_MAX_FRAME_INDEX = 2 ** 31 - 1
+# the claim priority of a frame is its rank times the range of the frame indices plus its reversed index,
+# small enough to stay exact in floating point, sample frames rank highest, the others by their estimate
+# in tenths of a second
+_PRIORITY_FRAME_RANGE = 2 ** 31
+_SAMPLE_RANK = 2 ** 22 - 1
+# open frames locked per claim, out of which the most contiguous batch is picked
+_CLAIM_CANDIDATE_FACTOR = 2
+
+# per process cache of the ids behind project, machine and status names, refreshed on a miss
+_ID_CACHE_QUERIES = {
+    'project': 'SELECT project_name, id FROM render_project;',
+    'machine': 'SELECT machine_name, id FROM render_machine;',
+    'project_status': 'SELECT status_name, id FROM render_project_status;',
+    'frame_status': 'SELECT status_name, id FROM frame_task_status;'
+}
+_id_cache = {kind: {} for kind in _ID_CACHE_QUERIES}
+
+# frames and tiles reserved by this process, their leases are renewed by the heartbeat until their status changes again
+_leased_frames = {}
+_leased_tiles = {}
+_leased_frames_lock = threading.Lock()
+
+# persistent Blender process of each render thread, only used with render.persistent_blender
+_blender_workers = threading.local()
+
+# projects whose files have been fetched into the local asset cache by this process
+_prefetched_projects = set()
+
+# smoothed render time per frame of this machine for each project, used to size adaptive batches
+_frame_time_estimates = {}
+
+# sampling step of each project, 0 for projects rendered in frame order
+_sample_steps = {}
+
+
+def refresh_id_cache(db, cursor, kind):
+    result = database.execute_statement(db, cursor, _ID_CACHE_QUERIES[kind], (), with_result=True)
+
+    if result is not None:
+        _id_cache[kind] = {name: id_ for name, id_ in result}
+        logging.debug('Loaded {} {} id(s) into the cache.'.format(len(result), kind))
+
+
+def lookup_id(db, cursor, kind, name):
+    if name not in _id_cache[kind]:
+        refresh_id_cache(db, cursor, kind)
+
+    return _id_cache[kind].get(name)
+
+
+def get_project_id(db, cursor, name):
+    return lookup_id(db, cursor, 'project', name)
+
+
+def get_machine_id(db, cursor, name):
+    return lookup_id(db, cursor, 'machine', name)
+
+
+def get_project_status_id(db, cursor, status):
+    return lookup_id(db, cursor, 'project_status', status)
+
+
+def get_frame_status_id(db, cursor, status):
+    return lookup_id(db, cursor, 'frame_status', status)
+
 
 def check_if_project_name_valid(args):
     project_name = args.project_name
@@ -28,7 +106,7 @@ def check_if_project_name_taken(args, db, cursor):
 def check_project_status(args, db, cursor):
     sql = '''
     SELECT render_project.id, project_name, filename, number_of_frames,
-        status_name, change_date FROM render_project
+        status_name, change_date, tiles_x, tiles_y, sample_step FROM render_project
         JOIN render_project_history 
             ON render_project.id = render_project_id
         JOIN render_project_status 
@@ -46,7 +124,10 @@ def check_project_status(args, db, cursor):
         'filename': result[2],
         'number_of_frames': result[3],
         'status': result[4],
-        'change_date': result[5]
+        'change_date': result[5],
+        'tiles_x': result[6],
+        'tiles_y': result[7],
+        'sample_step': result[8]
     }
 
 
@@ -59,12 +140,12 @@ def set_project_status(args, cfg, db, cursor, status):
     INSERT INTO render_project_history
         (render_project_id, change_date, status)
     VALUES
-        ((SELECT id FROM render_project WHERE project_name = %s), %s,
-        (SELECT id FROM render_project_status WHERE status_name = %s));
+        (%s, %s, %s);
     '''
     name = args.project_name
     now = dt.datetime.now(tz=dt.timezone.utc)
-    database.execute_statement(db, cursor, sql, (name, now, status), commit=True)
+    database.execute_statement(db, cursor, sql, (get_project_id(db, cursor, name), now,
+                                                 get_project_status_id(db, cursor, status)), commit=True)
 
     # TODO from what status
     logging.debug('Project status of "{}" changed to "{}".'.format(name, status))
@@ -100,41 +181,57 @@ def register_render_machine(cfg, db, cursor, name=None):
     logging.info('Render machine "{}" was successfully registered with the server.'.format(name))
 
 
-def start_project(args, cfg, db, cursor):
-    project_name = args.project_name
-
+def insert_project(args, db, cursor):
     sql = '''
     INSERT INTO render_project
-        (project_name, filename, number_of_frames)
+        (project_name, filename, number_of_frames, priority, tiles_x, tiles_y, sample_step)
     VALUES
-        (%s, %s, %s);
+        (%s, %s, %s, %s, %s, %s, %s);
     '''
     database.execute_statement(db, cursor, sql,
-        (project_name, args.filename, args.num_frames), commit=True)
+        (args.project_name, args.filename, args.num_frames, args.priority, args.tiles_x, args.tiles_y,
+         args.sample_step))
 
     project_id = cursor.lastrowid
-    logging.debug('Project "{}" created with id = {}.'.format(project_name, project_id))
 
     sql = '''
     INSERT INTO render_project_history(render_project_id, change_date, status)
-       VALUES (%s, %s,
-       (SELECT id FROM render_project_status WHERE status_name = "CREATED"));
+       VALUES (%s, %s, %s);
     '''
 
     now = dt.datetime.now(tz=dt.timezone.utc)
-    database.execute_statement(db, cursor, sql, (project_id, now), commit=True)
+    database.execute_statement(db, cursor, sql, (project_id, now, get_project_status_id(db, cursor, 'CREATED')))
 
-    sql = '''
-    INSERT INTO frame_task_history
-        (render_project_id, frame_index, change_date, machine_id, status)
-    VALUES
-        (%s, %s, %s,
-        (SELECT id FROM render_machine WHERE machine_name = "SERVER"),
-        (SELECT id FROM frame_task_status WHERE status_name = "CREATED"));
-    '''
+    # the ids are resolved once, so the frame rows can be written as plain multi-row inserts
+    machine_id = get_machine_id(db, cursor, 'SERVER')
+    status_id = get_frame_status_id(db, cursor, 'CREATED')
+
+    columns = ['render_project_id', 'frame_index', 'change_date', 'machine_id', 'status']
+    rows = [(project_id, i, now, machine_id, status_id) for i in range(args.num_frames)]
+
+    database.insert_rows(db, cursor, 'frame_task_history', columns, rows)
+    database.insert_rows(db, cursor, 'frame_task', columns + ['claim_priority'],
+                         [row + (get_claim_priority(row[1], args.sample_step),) for row in rows])
+
+    if args.tiles_x * args.tiles_y > 1:
+        database.insert_rows(db, cursor, 'frame_tile',
+                             ['render_project_id', 'frame_index', 'tile_index', 'change_date', 'machine_id', 'status'],
+                             [(project_id, i, tile, now, machine_id, status_id)
+                              for i in range(args.num_frames) for tile in range(args.tiles_x * args.tiles_y)])
+
+    return project_id
 
-    for i in range(args.num_frames):
-        database.execute_statement(db, cursor, sql, (project_id, i, now), commit=True)
+
+def start_project(args, cfg, db, cursor):
+    project_name = args.project_name
+
+    project_id = database.run_in_transaction(db, cursor, insert_project, args, db, cursor)
+
+    if project_id is None:
+        logging.error('Project "{}" could not be created.'.format(project_name))
+        return
+
+    logging.debug('Project "{}" created with id = {}.'.format(project_name, project_id))
 
     logging.info('Project "{}" successfully started. '.format(project_name) +
                  'To see info about the project run: python main.py check '
@@ -157,7 +254,7 @@ def cancel_project(args, cfg, db, cursor):
 
     logging.info('Project "{}" successfully cancelled.'.format(project_name))
 
-    print(get_project_frame_list(args, cfg, db, cursor))
+    print_frame_status_ranges(args, cfg, db, cursor)
 
 
 def finish_project(args, cfg, db, cursor):
@@ -172,109 +269,289 @@ def finish_project(args, cfg, db, cursor):
         return
 
     if not args.force:
-        open_frames = get_number_of_frames_with_status(args, cfg, db, cursor, 'CREATED')
+        counts = get_frame_status_counts(args, cfg, db, cursor)
+
+        open_frames = counts['CREATED']
         if open_frames > 0:
             logging.warning('There are still {} open frames. Render them or cancel them with:'.format(open_frames)
                             + '\r\n\t... "cancel --frames --all_frames"'
                             + '\r\n\t... "cancel --frames --by_machine <machine>"')
             return
 
-        reserved_frames = get_number_of_frames_with_status(args, cfg, db, cursor, 'RESERVED')
+        reserved_frames = counts['RESERVED']
         if reserved_frames > 0:
             logging.warning('There are still {} reserved frames. Wait for them or cancel them with:'.format(reserved_frames)
                             + '\r\n\t... "cancel --frames --all_frames"'
                             + '\r\n\t... "cancel --frames --by_machine <machine>"')
             return
     else:
-        set_all_frame_task_status_conditional(args, cfg, db, cursor, 'CANCELLED', 'CREATED')
-        set_all_frame_task_status_conditional(args, cfg, db, cursor, 'CANCELLED', 'RESERVED')
+        set_all_frame_task_status_conditional(args, cfg, db, cursor, 'CANCELLED', 'CREATED', 'RESERVED')
 
     set_project_status(args, cfg, db, cursor, 'FINISHED')
     status = check_project_status(args, db, cursor)
+    counts = get_frame_status_counts(args, cfg, db, cursor)
 
     logging.info('Project "{}" has been finished.'.format(name))
     print('Frames:')
     print('\tTotal:     {}'.format(status['number_of_frames']))
-    print('\tFinished:  {}'.format(get_number_of_frames_with_status(args, cfg, db, cursor, 'FINISHED')))
-    print('\tCancelled: {}'.format(get_number_of_frames_with_status(args, cfg, db, cursor, 'CANCELLED')))
-    print('\tFailed:    {}'.format(get_number_of_frames_with_status(args, cfg, db, cursor, 'FAILED')))
+    print('\tFinished:  {}'.format(counts['FINISHED']))
+    print('\tCancelled: {}'.format(counts['CANCELLED']))
+    print('\tFailed:    {}'.format(counts['FAILED']))
 
-    print(get_project_frame_list(args, cfg, db, cursor))
+    print_frame_status_ranges(args, cfg, db, cursor)
 
 
-def get_project_info(args, cfg, db, cursor):
+def get_project_report(args, cfg, db, cursor):
     status = check_project_status(args, db, cursor)
 
+    return {
+        'project_id': status['project_id'],
+        'project_name': status['project_name'],
+        'filename': status['filename'],
+        'status': status['status'],
+        'change_date': '{:%Y-%m-%d %H:%M:%S}'.format(status['change_date']),
+        'number_of_frames': status['number_of_frames'],
+        'frames': get_frame_status_counts(args, cfg, db, cursor),
+        'tiles': get_tile_status_counts(args, cfg, db, cursor) if is_tiled(status) else None,
+        'eta': get_project_eta(args, cfg, db, cursor)
+    }
+
+
+def get_project_info(args, cfg, db, cursor):
+    report = get_project_report(args, cfg, db, cursor)
+
+    if args.json:
+        print(json.dumps(report))
+        return
+
+    counts = report['frames']
+
     print('-' * 20)
-    print('Project name:  {} (id={})'.format(status['project_name'], status['project_id']))
-    print('Filename:      {}'.format(status['filename']))
-    print('Latest Status: {} (changed {:%Y-%m-%d %H:%M:%S})'.format(status['status'], status['change_date']))
+    print('Project name:  {} (id={})'.format(report['project_name'], report['project_id']))
+    print('Filename:      {}'.format(report['filename']))
+    print('Latest Status: {} (changed {})'.format(report['status'], report['change_date']))
     print('')
 
     print('Frames:')
-    print('\tTotal:     {}'.format(status['number_of_frames']))
-    print('\tOpen:      {}'.format(get_number_of_frames_with_status(args, cfg, db, cursor, 'CREATED')))
-    print('\tReserved:  {}'.format(get_number_of_frames_with_status(args, cfg, db, cursor, 'RESERVED')))
-    print('\tFinished:  {}'.format(get_number_of_frames_with_status(args, cfg, db, cursor, 'FINISHED')))
-    print('\tCancelled: {}'.format(get_number_of_frames_with_status(args, cfg, db, cursor, 'CANCELLED')))
-    print('\tFailed:    {}'.format(get_number_of_frames_with_status(args, cfg, db, cursor, 'FAILED')))
+    print('\tTotal:     {}'.format(report['number_of_frames']))
+    print('\tOpen:      {}'.format(counts['CREATED']))
+    print('\tReserved:  {}'.format(counts['RESERVED']))
+    print('\tFinished:  {}'.format(counts['FINISHED']))
+    print('\tCancelled: {}'.format(counts['CANCELLED']))
+    print('\tFailed:    {}'.format(counts['FAILED']))
+
+    eta = report['eta']
+    print('')
+    if eta is None:
+        print('ETA:           unknown, no frame has been rendered yet')
+    elif eta['remaining_seconds'] == 0:
+        print('ETA:           no frames left')
+    elif eta['eta_seconds'] is None:
+        print('ETA:           {} of render time left, no machine is rendering'.format(
+            format_duration(eta['remaining_seconds'])))
+    else:
+        print('ETA:           {} ({} of render time left on {} machine(s))'.format(
+            format_duration(eta['eta_seconds']), format_duration(eta['remaining_seconds']), eta['machines']))
+
+    if report['tiles'] is not None:
+        counts = report['tiles']
+
+        print('')
+        print('Tiles:')
+        print('\tOpen:      {}'.format(counts['CREATED']))
+        print('\tReserved:  {}'.format(counts['RESERVED']))
+        print('\tFinished:  {}'.format(counts['FINISHED']))
+        print('\tFailed:    {}'.format(counts['FAILED']))
+
+
+def get_frame_list_condition(args, db, cursor):
+    # the filters of check --frame_list, frames are paged by their index so a page never shifts
+    conditions, params = [], ()
+
+    if args.status is not None:
+        conditions.append('ft.status = %s')
+        params += (get_frame_status_id(db, cursor, args.status),)
 
+    if args.machine is not None:
+        conditions.append('ft.machine_id = %s')
+        params += (get_machine_id(db, cursor, args.machine),)
 
-def get_project_frame_list(args, cfg, db, cursor):
+    if args.frame_range is not None:
+        condition, condition_params = frame_range.get_range_condition(
+            'ft.frame_index', frame_range.parse_ranges(args.frame_range))
+        conditions.append(condition)
+        params += condition_params
+
+    if args.after is not None:
+        conditions.append('ft.frame_index > %s')
+        params += (args.after,)
+
+    return ' AND '.join(conditions) if len(conditions) > 0 else '1 = 1', params
+
+
+def iterate_project_frame_list(db, cursor, project_id, condition='1 = 1', params=(), limit=0):
+    # read from the current status table, the history of compacted projects is gone
     sql = '''
-    SELECT frame_task_history.frame_index, status_name, render_machine.machine_name, change_date  FROM frame_task_history
-        JOIN render_project
-            ON render_project.id = render_project_id
+    SELECT ft.frame_index, status_name, render_machine.machine_name, ft.change_date FROM frame_task ft
         LEFT JOIN render_machine
-            ON render_machine.id = machine_id
-        JOIN frame_task_status fts 
-            ON frame_task_history.status = fts.id
-        JOIN (
-            SELECT render_project_id, frame_index, MAX(change_date) as max_date FROM frame_task_history
-                JOIN render_project
-                    ON render_project.id = render_project_id
-                WHERE project_name = %s
-                GROUP BY render_project_id, frame_index
-        ) sub_table ON sub_table.frame_index = frame_task_history.frame_index AND sub_table.max_date = change_date
-        WHERE project_name = %s ORDER BY frame_task_history.frame_index;
-    '''
+            ON render_machine.id = ft.machine_id
+        JOIN frame_task_status fts
+            ON ft.status = fts.id
+        WHERE ft.render_project_id = %s AND {}
+        ORDER BY ft.frame_index{};
+    '''.format(condition, ' LIMIT %s' if limit > 0 else '')
+
+    return database.stream_statement(db, cursor, sql,
+                                     (project_id,) + params + ((limit,) if limit > 0 else ()))
+
+
+def format_duration(seconds):
+    return str(dt.timedelta(seconds=int(round(seconds))))
 
-    name = args.project_name
-    result = database.execute_statement(db, cursor, sql, (name, name), with_result=True)
+
+def get_project_frame_list(args, cfg, db, cursor, rows=None):
+    if rows is None:
+        rows = iterate_project_frame_list(db, cursor, get_project_id(db, cursor, args.project_name))
 
     x = PrettyTable()
     x.field_names = ['frame', 'status', 'render machine', 'change date']
-    for row in result:
+    for row in rows:
         x.add_row(row)
 
     return x
 
 
-def get_number_of_frames_with_status(args, cfg, db, cursor, status):
-    name = args.project_name
+def get_frame_status_ranges(rows):
+    # runs of consecutive frames with the same status and machine, e.g. "0-4999 FINISHED", "5000-5120 RESERVED@node7"
+    # only reservations name their machine, finished frames of different machines are merged
+    run = None
+
+    for frame, status, machine, _ in rows:
+        machine = machine if status == 'RESERVED' else None
+        if run is not None and frame == run[1] + 1 and [status, machine] == run[2:]:
+            run[1] = frame
+            continue
+
+        if run is not None:
+            yield format_frame_status_range(*run)
+
+        run = [frame, frame, status, machine]
+
+    if run is not None:
+        yield format_frame_status_range(*run)
+
+
+def format_frame_status_range(start, end, status, machine):
+    frames = str(start) if start == end else '{}-{}'.format(start, end)
+    return '{} {}'.format(frames, status) + ('@' + machine if machine is not None else '')
+
 
+def print_frame_status_ranges(args, cfg, db, cursor):
+    for line in get_frame_status_ranges(iterate_project_frame_list(db, cursor,
+                                                                   get_project_id(db, cursor, args.project_name))):
+        print(line)
+
+
+def print_project_frame_list(args, cfg, db, cursor):
+    condition, params = get_frame_list_condition(args, db, cursor)
+    rows = iterate_project_frame_list(db, cursor, get_project_id(db, cursor, args.project_name),
+                                      condition, params, args.limit)
+
+    # everything but the table is written row by row, so the memory use does not grow with the project
+    if args.list_format == 'table':
+        print(get_project_frame_list(args, cfg, db, cursor, rows))
+
+    elif args.list_format == 'ranges':
+        for line in get_frame_status_ranges(rows):
+            print(line)
+
+    else:
+        writer = csv.writer(sys.stdout)
+        if args.list_format == 'csv':
+            writer.writerow(['frame', 'status', 'render machine', 'change date'])
+
+        for frame, status, machine, change_date in rows:
+            change_date = '{:%Y-%m-%d %H:%M:%S.%f}'.format(change_date) if change_date is not None else None
+
+            if args.list_format == 'csv':
+                writer.writerow([frame, status, machine, change_date])
+            else:
+                print(json.dumps({'frame': frame, 'status': status, 'machine': machine,
+                                  'change_date': change_date}))
+
+
+def get_frame_status_counts(args, cfg, db, cursor):
+    # one round trip over the current status table instead of one history scan per status
     sql = '''
-    SELECT COUNT(*) FROM frame_task_history
-        JOIN frame_task_status
-            ON frame_task_history.status = frame_task_status.id
-        JOIN render_project rp 
-            ON frame_task_history.render_project_id = rp.id
-        JOIN (
-            SELECT render_project_id, frame_index, MAX(change_date) as max_date FROM frame_task_history
-                JOIN render_project
-                    ON render_project.id = render_project_id
-                WHERE project_name = %s
-                GROUP BY render_project_id, frame_index
-        ) sub_table ON sub_table.frame_index = frame_task_history.frame_index AND sub_table.max_date = change_date
-        WHERE project_name = %s AND frame_task_status.status_name = %s;
+    SELECT status_name, COUNT(frame_index) FROM frame_task_status
+        LEFT JOIN frame_task
+            ON frame_task.status = frame_task_status.id AND render_project_id = %s
+        GROUP BY status_name;
     '''
-    result = database.execute_statement(db, cursor, sql, (name, name, status), with_result=True)[0][0]
+    result = database.execute_statement(db, cursor, sql, (get_project_id(db, cursor, args.project_name),),
+                                        with_result=True)
+
+    counts = {status: 0 for status in _VALID_FRAME_STATUS}
+    for status, count in result:
+        counts[status] = count
+
+    return counts
+
+
+def get_tile_status_counts(args, cfg, db, cursor):
+    sql = '''
+    SELECT status_name, COUNT(tile_index) FROM frame_task_status
+        LEFT JOIN frame_tile
+            ON frame_tile.status = frame_task_status.id AND render_project_id = %s
+        GROUP BY status_name;
+    '''
+    result = database.execute_statement(db, cursor, sql, (get_project_id(db, cursor, args.project_name),),
+                                        with_result=True)
+
+    counts = {status: 0 for status in _VALID_FRAME_STATUS}
+    for status, count in result:
+        counts[status] = count
+
+    return counts
+
+
+def get_number_of_frames_with_status(args, cfg, db, cursor, status):
+    sql = '''
+    SELECT COUNT(*) FROM frame_task
+        WHERE render_project_id = %s AND status = %s;
+    '''
+    result = database.execute_statement(db, cursor, sql, (get_project_id(db, cursor, args.project_name),
+                                                          get_frame_status_id(db, cursor, status)),
+                                        with_result=True)[0][0]
 
     return result
 
 
 def has_project_open_frames(args, cfg, db, cursor):
-    return get_number_of_frames_with_status(args, cfg, db, cursor, 'CREATED') > 0
+    status = check_project_status(args, db, cursor)
+    if is_tiled(status):
+        return has_project_open_tiles(args, cfg, db, cursor, status['project_id'])
+
+    if dispatcher.is_enabled(cfg):
+        open_frames = dispatcher.count_open(cfg, status['project_id'])
+        if open_frames is not None:
+            return open_frames > 0
+
+    # reservations with an expired lease are open again, frames waiting for a retry count as open,
+    # frames that failed too often on this machine are left to the others
+    condition, params = get_machine_failure_condition(cfg, db, cursor)
+
+    sql = '''
+    SELECT COUNT(*) FROM frame_task ft
+        WHERE render_project_id = %s
+            AND (status = %s OR (status = %s AND lease_expires < UTC_TIMESTAMP(6))) AND {};
+    '''.format(condition)
+    result = database.execute_statement(db, cursor, sql, (get_project_id(db, cursor, args.project_name),
+                                                          get_frame_status_id(db, cursor, 'CREATED'),
+                                                          get_frame_status_id(db, cursor, 'RESERVED')) + params,
+                                        with_result=True)[0][0]
+
+    return result > 0
 
 
 def is_frame_status_valid(status):
@@ -289,179 +566,1222 @@ def set_frame_task_status(args, cfg, db, cursor, status, frames):
     if not is_frame_status_valid(status):
         return
 
+    if len(frames) == 0:
+        return
+
     now = dt.datetime.now(tz=dt.timezone.utc)
+    name = args.project_name
+
+    project_id = get_project_id(db, cursor, name)
+    machine_id = get_machine_id(db, cursor, cfg['general']['machine_name'])
+    status_id = get_frame_status_id(db, cursor, status)
+    lease_seconds = cfg['render']['lease_seconds'] if status == 'RESERVED' else None
+
+    # claims select the frames they reserve themselves, every other change is a result of this machine and only
+    # applies to the frames it still holds
+    changed = database.run_in_transaction(db, cursor, write_frame_task_status,
+                                          db, cursor, project_id, frames, now, machine_id, status_id, lease_seconds,
+                                          status != 'RESERVED')
+
+    if status != 'RESERVED':
+        release_leases(project_id, frames)
+
+    if changed is None:
+        return
+
+    if status == 'FAILED':
+        metrics.inc('frames_failed_total', len(changed), project=name)
+
+    ignored = [f for f in frames if f not in changed]
+    if len(ignored) > 0:
+        logging.warning('Frame(s) {} of project "{}" are no longer reserved by this machine, they are left as they '
+                        'are instead of {}.'.format(frame_range.format_ranges(ignored), name, status))
+
+    logging.debug('Render status for project "{}" for the frame(s) {} has been changed to {}'
+                  .format(name, frame_range.format_ranges(changed), status))
+
+
+def write_frame_task_status(db, cursor, project_id, frames, now, machine_id, status_id, lease_seconds=None,
+                            held_only=False):
+    # returns the changed frames, with held_only only the frames the machine still has reserved are changed, so a
+    # late result does not overwrite a frame that was cancelled or reclaimed by another machine in the meantime
+    held_condition = ' AND machine_id = %s AND status = %s' if held_only else ''
+    held_params = (machine_id, get_frame_status_id(db, cursor, 'RESERVED')) if held_only else ()
+    changed = []
+
+    # the statements select the frames by contiguous ranges, so their size depends on the number of runs only
+    for ranges in database.chunked(frame_range.to_ranges(frames), _RANGES_PER_STATEMENT):
+        condition, condition_params = frame_range.get_range_condition('frame_index', ranges)
+
+        # keeps the current status table in line with the latest history entry, the lease is
+        # cleared for every status but RESERVED since an interval of NULL yields NULL
+        sql = '''
+        UPDATE frame_task SET change_date = %s, machine_id = %s, status = %s,
+                lease_expires = DATE_ADD(UTC_TIMESTAMP(6), INTERVAL %s SECOND)
+            WHERE render_project_id = %s AND {}{};
+        '''.format(condition, held_condition)
+        database.execute_statement(db, cursor, sql, (now, machine_id, status_id, lease_seconds, project_id)
+                                   + condition_params + held_params)
+
+        # the history picks up exactly the rows stamped with this change
+        stamp_condition = ('render_project_id = %s AND {} AND change_date = %s AND machine_id = %s AND status = %s'
+                           .format(condition))
+        stamp_params = (project_id,) + condition_params + (now, machine_id, status_id)
+
+        sql = '''
+        INSERT IGNORE INTO frame_task_history
+            (render_project_id, frame_index, change_date, machine_id, status)
+        SELECT render_project_id, frame_index, change_date, machine_id, status FROM frame_task
+            WHERE {};
+        '''.format(stamp_condition)
+        database.execute_statement(db, cursor, sql, stamp_params)
+
+        if held_only:
+            result = database.execute_statement(db, cursor, 'SELECT frame_index FROM frame_task WHERE {};'.format(
+                stamp_condition), stamp_params, with_result=True)
+            changed += [row[0] for row in result]
+
+    return sorted(changed) if held_only else frames
+
+
+def hold_leases(project_id, frames):
+    with _leased_frames_lock:
+        _leased_frames.setdefault(project_id, set()).update(frames)
+
+
+def release_leases(project_id, frames):
+    with _leased_frames_lock:
+        if project_id in _leased_frames:
+            _leased_frames[project_id].difference_update(frames)
+
+
+def hold_tile_lease(project_id, frame, tile):
+    with _leased_frames_lock:
+        _leased_tiles.setdefault(project_id, set()).add((frame, tile))
+
+
+def release_tile_lease(project_id, frame, tile):
+    with _leased_frames_lock:
+        _leased_tiles.get(project_id, set()).discard((frame, tile))
+
+
+def renew_leases(cfg, db, cursor):
+    with _leased_frames_lock:
+        leased_frames = {project_id: sorted(frames) for project_id, frames in _leased_frames.items() if frames}
+        leased_tiles = {project_id: sorted(tiles) for project_id, tiles in _leased_tiles.items() if tiles}
+
+    machine_id = get_machine_id(db, cursor, cfg['general']['machine_name'])
+    status_id = get_frame_status_id(db, cursor, 'RESERVED')
+
+    # only reservations still owned by this machine are extended, frames that were reclaimed stay with their new owner
+    for project_id, frames in leased_frames.items():
+        if dispatcher.is_enabled(cfg) and dispatcher.renew(cfg, project_id, frames):
+            continue
+
+        for chunk in database.chunked(frames):
+            sql = '''
+            UPDATE frame_task SET lease_expires = DATE_ADD(UTC_TIMESTAMP(6), INTERVAL %s SECOND)
+                WHERE render_project_id = %s AND machine_id = %s AND status = %s AND frame_index IN ({});
+            '''.format(', '.join(['%s'] * len(chunk)))
+            database.execute_statement(db, cursor, sql, (cfg['render']['lease_seconds'], project_id, machine_id,
+                                                         status_id) + tuple(chunk), commit=True)
+
+    for project_id, project_tiles in leased_tiles.items():
+        sql = '''
+        UPDATE frame_tile SET lease_expires = DATE_ADD(UTC_TIMESTAMP(6), INTERVAL %s SECOND)
+            WHERE render_project_id = %s AND machine_id = %s AND status = %s AND ({});
+        '''.format(' OR '.join(['(frame_index = %s AND tile_index = %s)'] * len(project_tiles)))
+        database.execute_statement(db, cursor, sql, (cfg['render']['lease_seconds'], project_id, machine_id, status_id)
+                                   + tuple(value for tile in project_tiles for value in tile), commit=True)
+
+    if len(leased_frames) > 0 or len(leased_tiles) > 0:
+        logging.debug('Renewed the leases of {} reserved frame(s) and {} tile(s).'.format(
+            sum(len(frames) for frames in leased_frames.values()),
+            sum(len(project_tiles) for project_tiles in leased_tiles.values())))
+
+
+def get_machine_failure_condition(cfg, db, cursor):
     sql = '''
-    INSERT IGNORE INTO frame_task_history
-        (render_project_id, frame_index, change_date, machine_id, status)
-    VALUES
-        (
-            (SELECT id FROM render_project WHERE project_name = %s),
-            %s,
-            %s,
-            (SELECT id FROM render_machine WHERE machine_name = %s),
-            (SELECT id FROM frame_task_status WHERE status_name = %s)
-        );
+    NOT EXISTS (SELECT 1 FROM frame_failure ff
+        WHERE ff.render_project_id = ft.render_project_id AND ff.frame_index = ft.frame_index
+            AND ff.machine_id = %s AND ff.failures >= %s)
     '''
-    name = args.project_name
+    return sql, (get_machine_id(db, cursor, cfg['general']['machine_name']), int(cfg['retry']['failures_per_machine']))
 
-    for i in frames:
-        database.execute_statement(db, cursor, sql, (name, i, now, cfg['general']['machine_name'], status), commit=True)
 
-    if len(frames) > 0:
-        logging.debug('Render status for project "{}" for the frame(s) {} has been changed to {}'
-                      .format(name, ', '.join([str(f) for f in frames]), status))
+def get_retry_condition(cfg, db, cursor):
+    # failed frames wait for their backoff to pass and are steered away from the machines they failed on
+    condition, params = get_machine_failure_condition(cfg, db, cursor)
+    return '(ft.retry_after IS NULL OR ft.retry_after <= UTC_TIMESTAMP(6)) AND ' + condition, params
+
+
+def get_retry_delay(cfg, attempts):
+    return min(float(cfg['retry']['max_delay']), float(cfg['retry']['delay']) * 2 ** (attempts - 1))
+
+
+def fail_frames(args, cfg, db, cursor, frames):
+    # failed frames go back into the queue with a growing delay until they have used up their attempts
+    if len(frames) == 0:
+        return
+
+    project_id = get_project_id(db, cursor, args.project_name)
+    machine_id = get_machine_id(db, cursor, cfg['general']['machine_name'])
+
+    failures = None
+    if dispatcher.is_enabled(cfg):
+        failures = dispatcher.fail(cfg, project_id, frames)
+
+    if failures is None:
+        failures = database.run_in_transaction(db, cursor, write_frame_failures,
+                                               cfg, db, cursor, project_id, machine_id, frames)
+
+    release_leases(project_id, frames)
+    metrics.inc('frames_failed_total', len(frames), project=args.project_name)
+    record_machine_failure(cfg, db, cursor, machine_id)
+
+    if failures is None:
+        return
+
+    retried, failed = failures['retried'], failures['failed']
+    ignored = [f for f in frames if f not in retried and f not in failed]
+
+    if len(retried) > 0:
+        logging.warning('Frame(s) {} of project "{}" failed and will be retried.'.format(
+            frame_range.format_ranges(retried), args.project_name))
+    if len(failed) > 0:
+        logging.error('Frame(s) {} of project "{}" used up their {} attempts or failed on every available machine '
+                      'and are given up.'.format(frame_range.format_ranges(failed), args.project_name,
+                                                 cfg['retry']['max_attempts']))
+    if len(ignored) > 0:
+        logging.warning('Frame(s) {} of project "{}" failed, but are no longer reserved by this machine.'.format(
+            frame_range.format_ranges(ignored), args.project_name))
+
+
+def write_frame_failures(cfg, db, cursor, project_id, machine_id, frames):
+    # only the frames the machine still holds are failed, a late failure must not requeue a frame that was
+    # cancelled or reclaimed by another machine in the meantime
+    now = dt.datetime.now(tz=dt.timezone.utc)
+
+    condition, condition_params = frame_range.get_range_condition('frame_index', frame_range.to_ranges(frames))
+    result = database.execute_statement(db, cursor, '''
+    SELECT frame_index, attempts FROM frame_task
+        WHERE render_project_id = %s AND {} AND machine_id = %s AND status = %s
+        FOR UPDATE;
+    '''.format(condition), (project_id,) + condition_params
+                                        + (machine_id, get_frame_status_id(db, cursor, 'RESERVED')), with_result=True)
+
+    frames = [row[0] for row in result]
+    if len(frames) == 0:
+        return {'retried': [], 'failed': []}
+
+    for chunk in database.chunked(frames):
+        sql = '''
+        INSERT INTO frame_failure (render_project_id, frame_index, machine_id, failures, last_failure)
+            VALUES {}
+        ON DUPLICATE KEY UPDATE failures = failures + 1, last_failure = VALUES(last_failure);
+        '''.format(', '.join(['(%s, %s, %s, 1, %s)'] * len(chunk)))
+        database.execute_statement(db, cursor, sql,
+                                   tuple(value for f in chunk for value in (project_id, f, machine_id, now)))
+
+    # frames no machine can take anymore would stay open forever, e.g. on a farm with a single machine
+    stranded_frames = get_stranded_frames(cfg, db, cursor, project_id, frames)
+
+    by_attempts = {}
+    for frame, attempts in result:
+        retry = attempts + 1 < int(cfg['retry']['max_attempts']) and frame not in stranded_frames
+        by_attempts.setdefault((attempts + 1, retry), []).append(frame)
+
+    # the failure stays in the history, a retry follows it as a new entry right after
+    failed_id = get_frame_status_id(db, cursor, 'FAILED')
+    created_id = get_frame_status_id(db, cursor, 'CREATED')
+    retried = []
+
+    for (attempts, retry), group in by_attempts.items():
+        write_frame_task_status(db, cursor, project_id, group, now, machine_id, failed_id)
+
+        if retry:
+            write_frame_task_status(db, cursor, project_id, group, now + dt.timedelta(microseconds=1),
+                                    machine_id, created_id)
+            retried += group
+
+        condition, condition_params = frame_range.get_range_condition('frame_index', frame_range.to_ranges(group))
+        database.execute_statement(db, cursor, '''
+        UPDATE frame_task SET attempts = %s, retry_after = DATE_ADD(UTC_TIMESTAMP(6), INTERVAL %s SECOND)
+            WHERE render_project_id = %s AND {};
+        '''.format(condition), (attempts, get_retry_delay(cfg, attempts) if retry else None, project_id)
+                                   + condition_params)
+
+    return {'retried': sorted(retried), 'failed': sorted(f for f in frames if f not in retried)}
+
+
+def get_stranded_frames(cfg, db, cursor, project_id, frames):
+    # the frames every registered machine outside of quarantine has failed too often to be handed it again,
+    # the server entry does not render
+    condition, condition_params = frame_range.get_range_condition('ft.frame_index', frame_range.to_ranges(frames))
+    result = database.execute_statement(db, cursor, '''
+    SELECT ft.frame_index FROM frame_task ft
+        WHERE ft.render_project_id = %s AND {} AND NOT EXISTS (
+            SELECT 1 FROM render_machine rm
+                WHERE rm.id <> %s AND (rm.quarantined_until IS NULL OR rm.quarantined_until <= UTC_TIMESTAMP(6))
+                    AND NOT EXISTS (SELECT 1 FROM frame_failure ff
+                        WHERE ff.render_project_id = ft.render_project_id AND ff.frame_index = ft.frame_index
+                            AND ff.machine_id = rm.id AND ff.failures >= %s));
+    '''.format(condition), (project_id,) + condition_params + (get_machine_id(db, cursor, 'SERVER'),
+                                                                  int(cfg['retry']['failures_per_machine'])),
+                                        with_result=True)
+
+    return {row[0] for row in result} if result is not None else set()
+
+
+def record_machine_failure(cfg, db, cursor, machine_id):
+    # a machine that keeps failing is taken out of the farm for a while, so it stops burning through the queue
+    database.execute_statement(db, cursor, '''
+    UPDATE render_machine SET consecutive_failures = consecutive_failures + 1 WHERE id = %s;
+    ''', (machine_id,), commit=True)
+
+    database.execute_statement(db, cursor, '''
+    UPDATE render_machine
+        SET quarantined_until = DATE_ADD(UTC_TIMESTAMP(6), INTERVAL %s SECOND), consecutive_failures = 0
+        WHERE id = %s AND consecutive_failures >= %s;
+    ''', (cfg['retry']['quarantine_seconds'], machine_id, int(cfg['retry']['quarantine_failures'])), commit=True)
+
+    if is_machine_quarantined(cfg, db, cursor):
+        logging.error('Machine "{}" failed {} times in a row and is quarantined for {}s.'.format(
+            cfg['general']['machine_name'], cfg['retry']['quarantine_failures'], cfg['retry']['quarantine_seconds']))
+
+
+def record_machine_success(cfg, db, cursor):
+    database.execute_statement(db, cursor, '''
+    UPDATE render_machine SET consecutive_failures = 0 WHERE id = %s AND consecutive_failures > 0;
+    ''', (get_machine_id(db, cursor, cfg['general']['machine_name']),), commit=True)
+
+
+def is_machine_quarantined(cfg, db, cursor):
+    result = database.execute_statement(db, cursor, '''
+    SELECT COUNT(*) FROM render_machine WHERE id = %s AND quarantined_until > UTC_TIMESTAMP(6);
+    ''', (get_machine_id(db, cursor, cfg['general']['machine_name']),), with_result=True)
+
+    return result is not None and result[0][0] > 0
 
 
 def set_all_frame_task_status(args, cfg, db, cursor, status):
+    # finished frames are kept, their images have been uploaded already
     if not is_frame_status_valid(status):
         return
 
-    sql = '''
-    SELECT frame_index FROM frame_task_history
-        JOIN render_project rp 
-            ON frame_task_history.render_project_id = rp.id
-        WHERE project_name = %s;
-    '''
-    frames = [row[0] for row in database.execute_statement(db, cursor, sql, (args.project_name,), with_result=True)]
+    condition = 'status NOT IN (%s, %s)'
+    params = (get_frame_status_id(db, cursor, 'FINISHED'), get_frame_status_id(db, cursor, status))
 
-    set_frame_task_status(args, cfg, db, cursor, status, frames)
+    return set_frame_task_status_where(args, cfg, db, cursor, status, condition, params)
 
 
-def set_all_frame_task_status_conditional(args, cfg, db, cursor, new_status, old_status):
-    if not is_frame_status_valid(new_status) or not is_frame_status_valid(old_status):
+def set_all_frame_task_status_conditional(args, cfg, db, cursor, new_status, *old_statuses):
+    if not is_frame_status_valid(new_status) or not all(is_frame_status_valid(status) for status in old_statuses):
         return
 
-    sql = '''
-    SELECT frame_index FROM frame_task_history
-        JOIN frame_task_status 
-            ON status = frame_task_status.id
-        JOIN render_project rp 
-            ON frame_task_history.render_project_id = rp.id
-        WHERE project_name = %s AND status_name = %s;
-    '''
-    frames = [row[0] for row in database.execute_statement(db, cursor, sql, (args.project_name, old_status), with_result=True)]
+    condition = 'status IN ({})'.format(', '.join(['%s'] * len(old_statuses)))
+    params = tuple(get_frame_status_id(db, cursor, status) for status in old_statuses)
 
-    set_frame_task_status(args, cfg, db, cursor, new_status, frames)
+    return set_frame_task_status_where(args, cfg, db, cursor, new_status, condition, params)
 
 
 def set_all_frame_task_status_by_machine(args, cfg, db, cursor, machine, status):
+    # only the frames the machine still works on, not the ones it finished or that moved on to another machine
     if not is_frame_status_valid(status):
         return
 
+    condition = 'machine_id = %s AND status IN (%s, %s)'
+    params = (get_machine_id(db, cursor, machine), get_frame_status_id(db, cursor, 'RESERVED'),
+              get_frame_status_id(db, cursor, 'FAILED'))
+
+    return set_frame_task_status_where(args, cfg, db, cursor, status, condition, params)
+
+
+def set_frame_task_status_where(args, cfg, db, cursor, status, condition, params):
+    # the frames are selected by the database, so a bulk transition costs two statements regardless of its size
+    now = dt.datetime.now(tz=dt.timezone.utc)
+
+    project_id = get_project_id(db, cursor, args.project_name)
+    machine_id = get_machine_id(db, cursor, cfg['general']['machine_name'])
+    status_id = get_frame_status_id(db, cursor, status)
+
+    changed = database.run_in_transaction(db, cursor, write_frame_task_status_where,
+                                          db, cursor, project_id, now, machine_id, status_id, condition, params)
+
+    logging.debug('Render status for project "{}" for {} frame(s) has been changed to {}'.format(
+        args.project_name, changed, status))
+
+    return changed
+
+
+def write_frame_task_status_where(db, cursor, project_id, now, machine_id, status_id, condition, params,
+                                  lease_seconds=None):
+    # the current status is changed first, which locks the rows, the history then picks up exactly the
+    # rows stamped with this change
     sql = '''
-    SELECT frame_index FROM frame_task_history
-        JOIN frame_task_status ON status = frame_task_status.id
-        JOIN render_machine ON render_machine.id = machine_id
-        WHERE render_project_id = (SELECT id FROM render_project WHERE project_name = %s)
-            AND machine_name = %s;
+    UPDATE frame_task SET change_date = %s, machine_id = %s, status = %s,
+            lease_expires = DATE_ADD(UTC_TIMESTAMP(6), INTERVAL %s SECOND)
+        WHERE render_project_id = %s AND {};
+    '''.format(condition)
+    database.execute_statement(db, cursor, sql, (now, machine_id, status_id, lease_seconds, project_id) + params)
+    changed = cursor.rowcount
+
+    sql = '''
+    INSERT IGNORE INTO frame_task_history
+        (render_project_id, frame_index, change_date, machine_id, status)
+    SELECT render_project_id, frame_index, change_date, machine_id, status FROM frame_task
+        WHERE render_project_id = %s AND change_date = %s AND machine_id = %s AND status = %s;
     '''
-    frames = [row[0] for row in database.execute_statement(db, cursor, sql, (args.project_name, machine), with_result=True)]
+    database.execute_statement(db, cursor, sql, (project_id, now, machine_id, status_id))
 
-    set_frame_task_status(args, cfg, db, cursor, status, frames)
+    return changed
 
 
 def request_frames_to_render(args, cfg, db, cursor):
+    if is_machine_quarantined(cfg, db, cursor):
+        logging.warning('Machine "{}" is quarantined, not taking any work.'.format(cfg['general']['machine_name']))
+        return []
+
     status = check_project_status(args, db, cursor)
 
     if status['status'] != 'RUNNING':
         set_project_status(args, cfg, db, cursor, 'RUNNING')
 
-    sql = '''
-    SELECT * FROM frame_task_history
-        JOIN render_project rp
-            ON frame_task_history.render_project_id = rp.id
-        JOIN frame_task_status
-            ON frame_task_history.status = frame_task_status.id
-        JOIN (
-            SELECT render_project_id, frame_index, MAX(change_date) as max_date FROM frame_task_history
-                JOIN render_project
-                    ON render_project.id = render_project_id
-                WHERE project_name = %s
-                GROUP BY render_project_id, frame_index
-        ) sub_table ON sub_table.frame_index = frame_task_history.frame_index AND sub_table.max_date = change_date
-        WHERE project_name = %s AND frame_task_status.status_name = 'CREATED'
-        ORDER BY frame_task_history.frame_index
-        LIMIT %s;
-    '''
-    name = args.project_name
-    result = database.execute_statement(db, cursor, sql, (name, name, cfg['render']['frames_per_task']), with_result=True)
-
-    frames = [row[1] for row in result]
+    frames = claim_frames(args, cfg, db, cursor, status['project_id'],
+                          get_batch_size(args, cfg, db, cursor, status['project_id']))
 
     if len(frames) > 0:
-        set_frame_task_status(args, cfg, db, cursor, 'RESERVED', frames)
-        logging.info('Got task to render frame(s) {} of project "{}".'.format(name, ', '.join([str(f) for f in frames])))
+        logging.info('Got task to render frame(s) {} of project "{}".'.format(
+            frame_range.format_ranges(frames), args.project_name))
+
+        # the first claim of a project fetches the scene and its assets into the local cache
+        if cfg['cache']['enabled'] and args.project_name not in _prefetched_projects:
+            get_blender_input(args, cfg, status['filename'])
+            _prefetched_projects.add(args.project_name)
     else:
         logging.info('No open tasks remaining.')  # TODO check other tasks and offer finish
 
     return frames
 
 
-def render_frames(args, cfg, db, cursor):
+def record_render_time(args, cfg, number_of_frames, seconds):
+    key = (args.project_name, cfg['general']['machine_name'])
+    frame_time = seconds / number_of_frames
+    smoothing = float(cfg['render']['smoothing'])
+
+    if key in _frame_time_estimates:
+        _frame_time_estimates[key] = smoothing * frame_time + (1 - smoothing) * _frame_time_estimates[key]
+    else:
+        _frame_time_estimates[key] = frame_time
+
+
+def get_batch_size(args, cfg, db, cursor, project_id):
+    if not cfg['render']['adaptive_batch']:
+        return int(cfg['render']['frames_per_task'])
+
+    estimate = _frame_time_estimates.get((args.project_name, cfg['general']['machine_name']))
+
+    # until the first batch has been measured, the static batch size is used
+    if estimate is None or estimate <= 0:
+        batch_size = int(cfg['render']['frames_per_task'])
+    else:
+        batch_size = int(round(float(cfg['render']['target_batch_seconds']) / estimate))
+
+    batch_size = max(1, min(batch_size, int(cfg['render']['max_frames_per_task'])))
+
+    # near the end of the project the remaining frames are split evenly between the active machines,
+    # so no single machine holds a large batch that sets the makespan, the open frames are only counted
+    # up to the point where that matters, this machine is counted once whether it holds frames or not
+    machines_sql = '''
+    SELECT COUNT(DISTINCT machine_id) FROM frame_task
+        WHERE render_project_id = %s AND status = %s AND lease_expires >= UTC_TIMESTAMP(6) AND machine_id <> %s;
+    '''
+    open_frames_sql = '''
+    SELECT COUNT(*) FROM (
+        SELECT frame_index FROM frame_task
+            WHERE render_project_id = %s AND status = %s
+            LIMIT %s) open_frames;
+    '''
+    result = database.execute_statement(db, cursor, machines_sql,
+                                        (project_id, get_frame_status_id(db, cursor, 'RESERVED'),
+                                         get_machine_id(db, cursor, cfg['general']['machine_name'])),
+                                        with_result=True)
+    machines = (result[0][0] if result is not None else 0) + 1
+
+    result = database.execute_statement(db, cursor, open_frames_sql,
+                                        (project_id, get_frame_status_id(db, cursor, 'CREATED'),
+                                         batch_size * machines), with_result=True)
+    if result is not None and result[0][0] < batch_size * machines:
+        batch_size = max(1, -(-result[0][0] // machines))
+
+    logging.debug('Adaptive batch size for project "{}" is {} frame(s).'.format(args.project_name, batch_size))
+
+    return batch_size
+
+
+def claim_frames(args, cfg, db, cursor, project_id, number_of_frames):
+    with metrics.timer('claim_seconds'):
+        if dispatcher.is_enabled(cfg):
+            frames = dispatcher.claim(cfg, project_id, number_of_frames)
+        else:
+            frames = database.run_in_transaction(db, cursor, reserve_open_frames,
+                                                 args, cfg, db, cursor, project_id, number_of_frames)
+
+    if frames is None:
+        return []
+
+    hold_leases(project_id, frames)
+    metrics.inc('frames_claimed_total', len(frames), project=args.project_name)
+
+    return frames
+
+
+def get_sample_step(db, cursor, project_id):
+    # fixed when the project is created, so it is only read once per process
+    if project_id not in _sample_steps:
+        result = database.execute_statement(db, cursor, 'SELECT sample_step FROM render_project WHERE id = %s;',
+                                            (project_id,), with_result=True)
+        if result is None or len(result) == 0:
+            return 0
+
+        _sample_steps[project_id] = result[0][0]
+
+    return _sample_steps[project_id]
+
+
+def get_claim_priority(frame, sample_step):
+    # until the estimates are in, the frames besides the samples keep their order
+    rank = _SAMPLE_RANK if sample_step > 0 and frame % sample_step == 0 else 0
+    return rank * _PRIORITY_FRAME_RANGE + _MAX_FRAME_INDEX - frame
+
+
+def get_claim_order(db, cursor, project_id):
+    # sample first projects hand out every n-th frame first, then the frames with the highest estimated
+    # render time, so the long frames do not end up in the tail of the project, the claim priority holds
+    # that order so the claim reads it straight off the index
+    if get_sample_step(db, cursor, project_id) <= 0:
+        return 'ft.frame_index', ()
+
+    return 'ft.claim_priority DESC', ()
+
+
+def reserve_open_frames(args, cfg, db, cursor, project_id, number_of_frames):
+    # select and reserve in one transaction, rows locked by concurrent claims are skipped instead of
+    # waited for, so no frame is handed out twice and the claim only touches the current status table
+    retry_condition, retry_params = get_retry_condition(cfg, db, cursor)
+    order, order_params = get_claim_order(db, cursor, project_id)
+
+    sql = '''
+    SELECT frame_index FROM frame_task ft
+        WHERE render_project_id = %s AND status = %s AND {}
+        ORDER BY {}
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED;
+    '''.format(retry_condition, order)
+
+    # reservations of crashed machines are reclaimed first, so they do not hold up the end of the project
+    expired_sql = '''
+    SELECT frame_index FROM frame_task ft
+        WHERE render_project_id = %s AND status = %s AND lease_expires < UTC_TIMESTAMP(6) AND {}
+        ORDER BY frame_index
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED;
+    '''.format(retry_condition)
+    result = database.execute_statement(
+        db, cursor, expired_sql,
+        (project_id, get_frame_status_id(db, cursor, 'RESERVED')) + retry_params + (number_of_frames,),
+        with_result=True)
+    expired_frames = [row[0] for row in result]
+
+    if len(expired_frames) > 0:
+        logging.info('Reclaimed frame(s) {} with an expired lease.'.format(frame_range.format_ranges(expired_frames)))
+
+    # more candidates than needed are locked, so holes left by freed or cancelled frames can be skipped
+    # in favour of a contiguous run, the unused candidates are released again with the commit, sample first
+    # projects take the frames in their order instead
+    missing_frames = number_of_frames - len(expired_frames)
+    candidate_factor = _CLAIM_CANDIDATE_FACTOR if get_sample_step(db, cursor, project_id) <= 0 else 1
+    result = database.execute_statement(
+        db, cursor, sql, (project_id, get_frame_status_id(db, cursor, 'CREATED')) + retry_params + order_params
+        + (missing_frames * candidate_factor,),
+        with_result=True)
+    open_frames = frame_range.pick_contiguous([row[0] for row in result], missing_frames)
+
+    frames = sorted(expired_frames + open_frames)
+    set_frame_task_status(args, cfg, db, cursor, 'RESERVED', frames)
+
+    return frames
+
+
+def render_frames(args, cfg, db, cursor, threads=0):
+    # returns whether there was any work, so idle workers can back off
+    if is_machine_quarantined(cfg, db, cursor):
+        logging.warning('Machine "{}" is quarantined, not taking any work.'.format(cfg['general']['machine_name']))
+        return False
+
+    status = check_project_status(args, db, cursor)
+
+    if is_tiled(status):
+        return render_tiled_frames(args, cfg, db, cursor, status, threads)
+
     frames = request_frames_to_render(args, cfg, db, cursor)
 
     if len(frames) == 0:
-        return
+        return False
 
-    status = check_project_status(args, db, cursor)
+    rendered_frames = render_batch(args, cfg, db, cursor, status['filename'], frames, threads)
+    fail_frames(args, cfg, db, cursor, [f for f in frames if f not in rendered_frames])
+
+    if len(rendered_frames) > 0:
+        upload_batch(args, cfg, db, cursor, rendered_frames)
+
+    return True
+
+
+def get_blender_input(args, cfg, filename):
+    source = os.path.join('//', cfg['general']['input_path'], filename)
+
+    if not cfg['cache']['enabled']:
+        return source
+
+    # Blender reads the local copy, the shared file is only read again when it changed
+    try:
+        return asset_cache.prepare_project(cfg, args.project_name, source)
+    except Exception as e:
+        logging.error('The asset cache could not be used, rendering from "{}": {}'.format(source, e))
+        return source
+
+
+def get_output_pattern(cfg):
+    return os.path.join(os.getcwd(), cfg['general']['output_path'], cfg['general']['output_prefix'] + '_frame_#####')
+
+
+def render_batch(args, cfg, db, cursor, filename, frames, threads=0):
+    # returns the frames that were rendered, the caller marks the others as failed
+    if cfg['render']['persistent_blender']:
+        return render_batch_persistent(args, cfg, db, cursor, filename, frames, threads)
+
+    command = [cfg['general']['blender_path'], '-b', get_blender_input(args, cfg, filename),
+               '-o', get_output_pattern(cfg)]
+
+    # limits the render threads, so several Blender processes can share the machine
+    if threads > 0:
+        command += ['-t', str(threads)]
+
+    # one animation render per contiguous run, so frames between the runs are never rendered
+    for start, end in frame_range.to_ranges(frames):
+        command += ['-s', str(start), '-e', str(end), '-a']
+
+    remove_outputs(cfg, frames)
 
     try:
         start_time = time.time()
-        process = subprocess.Popen(
-            [cfg['general']['blender_path'], '-b',
-             os.path.join('//', cfg['general']['input_path'], status['filename']),
-             '-s', str(frames[0]), '-e', str(frames[-1]),
-             '-o', os.path.join(
-                os.getcwd(), cfg['general']['output_path'], cfg['general']['output_prefix'] + '_frame_#####'),
-             '-a'],
-            )
-        process.wait()
-
-        logging.debug('Blender exit code: ' + str(process.returncode))
+        returncode, stats = blender.run_blender(command)
+        metrics.inc('blender_exit_total', code=returncode)
+
+        rendered_frames = get_valid_frames(cfg, frames)
+        if returncode != 0:
+            # after a crash only the frames Blender reported as saved are trusted
+            saved_frames = set(stat['frame'] for stat in stats if stat['output_path'] is not None)
+            rendered_frames = [f for f in rendered_frames if f in saved_frames]
+
+            logging.error('Blender exited with code {} while rendering frames {}.'.format(
+                returncode, frame_range.format_ranges(frames)))
+        else:
+            logging.debug('Blender exit code: ' + str(returncode))
 
         end_time = time.time() - start_time
+        record_render_time(args, cfg, len(frames), end_time)
+        store_render_metrics(args, cfg, db, cursor, stats, returncode)
+
+        metrics.observe('render_seconds', end_time)
+        metrics.inc('frames_rendered_total', len(rendered_frames), project=args.project_name)
 
         logging.info('Finished rendering frames {} for project "{}" ({:0.3f}s).'.format(
-            ', '.join([str(f) for f in frames]), args.project_name, end_time))
+            frame_range.format_ranges(rendered_frames), args.project_name, end_time))
+
+        return rendered_frames
     except Exception as e:
         logging.critical('During the rendering by Blender an exception occurred: ' + str(e))
-        set_frame_task_status(args, cfg, db, cursor, 'FAILED', frames)
+        return []
+
+
+def render_batch_persistent(args, cfg, db, cursor, filename, frames, threads=0):
+    input_file = get_blender_input(args, cfg, filename)
+    worker = getattr(_blender_workers, 'worker', None)
+
+    # the scene stays loaded between batches, Blender is only started again for another file or after a crash
+    if worker is not None and (not blender.is_worker_alive(worker) or worker['filename'] != input_file
+                               or worker['threads'] != threads):
+        blender.stop_worker(worker)
+        worker = None
+
+    if worker is None:
+        try:
+            worker = blender.start_worker(cfg['general']['blender_path'], input_file, threads)
+        except Exception as e:
+            logging.critical('The persistent Blender process could not be started: ' + str(e))
+            worker = None
+
+        _blender_workers.worker = worker
+        if worker is None:
+            return []
+
+    remove_outputs(cfg, frames)
+
+    start_time = time.time()
+    results = blender.render_with_worker(worker, frames, get_output_pattern(cfg))
+    end_time = time.time() - start_time
+
+    valid_frames = get_valid_frames(cfg, [result['frame'] for result in results])
+    results = [result for result in results if result['frame'] in valid_frames]
+
+    if not blender.is_worker_alive(worker):
+        metrics.inc('blender_exit_total', code=worker['process'].poll())
+        logging.error('The persistent Blender process stopped while rendering frames {}, '
+                      'it will be restarted for the next batch.'.format(frame_range.format_ranges(frames)))
+        blender.stop_worker(worker)
+        _blender_workers.worker = None
+
+    rendered_frames = [result['frame'] for result in results]
 
-    filenames = [os.path.join(os.getcwd(), cfg['general']['output_path'],
-                              cfg['general']['output_prefix'] + '_frame_{:05}.png'.format(f))
-                 for f in frames]
+    if len(rendered_frames) > 0:
+        record_render_time(args, cfg, len(rendered_frames), sum(result['render_seconds'] for result in results))
+        store_render_metrics(args, cfg, db, cursor, results, None)
 
-    if dropbox_upload.upload_files(cfg['dropbox']['access_token'], filenames, cfg['dropbox']['folder_name'],
-                                   args.project_name):
-        set_frame_task_status(args, cfg, db, cursor, 'FINISHED', frames)
+        metrics.observe('render_seconds', end_time)
+        metrics.inc('frames_rendered_total', len(rendered_frames), project=args.project_name)
+
+        logging.info('Finished rendering frames {} for project "{}" ({:0.3f}s).'.format(
+            frame_range.format_ranges(rendered_frames), args.project_name, end_time))
+
+    return rendered_frames
+
+
+def stop_persistent_blender():
+    blender.stop_worker(getattr(_blender_workers, 'worker', None))
+    _blender_workers.worker = None
+
+
+def store_render_metrics(args, cfg, db, cursor, stats, returncode):
+    if len(stats) == 0:
+        return
+
+    project_id = get_project_id(db, cursor, args.project_name)
+    machine_id = get_machine_id(db, cursor, cfg['general']['machine_name'])
+    now = dt.datetime.now(tz=dt.timezone.utc)
+
+    database.insert_rows(db, cursor, 'frame_render_metric',
+                         ['render_project_id', 'frame_index', 'machine_id', 'render_date', 'render_seconds',
+                          'peak_memory_mb', 'output_path', 'blender_exit_code'],
+                         [(project_id, stat['frame'], machine_id, now, stat['render_seconds'],
+                           stat['peak_memory_mb'], stat['output_path'], returncode) for stat in stats],
+                         ignore=True, commit=True)
+
+    for stat in stats:
+        logging.debug('Frame {} rendered in {:0.2f}s with a peak memory of {} MB.'.format(
+            stat['frame'], stat['render_seconds'], stat['peak_memory_mb']))
+
+    update_frame_estimates(args, cfg, db, cursor, project_id, [stat['frame'] for stat in stats])
+
+
+def update_frame_estimates(args, cfg, db, cursor, project_id, frames):
+    # the estimates are interpolated once no sample frame is open anymore, and again for every sample
+    # frame that comes in later from the other machines
+    sample_step = get_sample_step(db, cursor, project_id)
+    if sample_step <= 0 or all(frame % sample_step != 0 for frame in frames):
+        return
+
+    result = database.execute_statement(db, cursor, '''
+    SELECT COUNT(*) FROM frame_task WHERE render_project_id = %s AND status = %s AND MOD(frame_index, %s) = 0;
+    ''', (project_id, get_frame_status_id(db, cursor, 'CREATED'), sample_step), with_result=True)
+    if result is None or result[0][0] > 0:
+        return
+
+    samples = database.run_in_transaction(db, cursor, write_frame_estimates, db, cursor, project_id, sample_step)
+    if samples:
+        logging.info('Estimated the render time of the frames of project "{}" from {} sample frame(s).'.format(
+            args.project_name, samples))
+
+
+def get_estimate_segments(samples):
+    # (first frame, last frame, estimate of the first frame, increase per frame), linear between the samples
+    # and constant before the first and after the last one
+    segments = [(0, samples[0][0] - 1, samples[0][1], 0)] if samples[0][0] > 0 else []
+
+    for (start, start_seconds), (end, end_seconds) in zip(samples, samples[1:]):
+        segments.append((start, end - 1, start_seconds, (end_seconds - start_seconds) / (end - start)))
+
+    return segments + [(samples[-1][0], _MAX_FRAME_INDEX, samples[-1][1], 0)]
+
+
+def write_frame_estimates(db, cursor, project_id, sample_step):
+    # frames rendered more than once count with their average render time
+    samples = database.execute_statement(db, cursor, '''
+    SELECT frame_index, AVG(render_seconds) FROM frame_render_metric
+        WHERE render_project_id = %s AND MOD(frame_index, %s) = 0 AND render_seconds IS NOT NULL
+        GROUP BY frame_index
+        ORDER BY frame_index;
+    ''', (project_id, sample_step), with_result=True)
+
+    if len(samples) == 0:
+        return 0
+
+    for segments in database.chunked(get_estimate_segments([(f, float(s)) for f, s in samples]),
+                                     _SEGMENTS_PER_STATEMENT):
+        sql = '''
+        UPDATE frame_task SET estimated_seconds = CASE {} END
+            WHERE render_project_id = %s AND frame_index BETWEEN %s AND %s;
+        '''.format(' '.join(['WHEN frame_index BETWEEN %s AND %s THEN %s + (frame_index - %s) * %s'] * len(segments)))
+        params = tuple(value for start, end, seconds, slope in segments for value in (start, end, seconds, start, slope))
+        database.execute_statement(db, cursor, sql, params + (project_id, segments[0][0], segments[-1][1]))
+
+    database.execute_statement(db, cursor, '''
+    UPDATE frame_task SET claim_priority = LEAST(ROUND(estimated_seconds * 10), %s) * %s + %s - frame_index
+        WHERE render_project_id = %s AND MOD(frame_index, %s) <> 0;
+    ''', (_SAMPLE_RANK - 1, _PRIORITY_FRAME_RANGE, _MAX_FRAME_INDEX, project_id, sample_step))
+
+    return len(samples)
+
+
+def get_project_eta(args, cfg, db, cursor):
+    # the open and reserved frames are summed up with their estimate, or the average render time of the
+    # project, and split between the machines rendering right now
+    project_id = get_project_id(db, cursor, args.project_name)
+    created_id = get_frame_status_id(db, cursor, 'CREATED')
+    reserved_id = get_frame_status_id(db, cursor, 'RESERVED')
+
+    remaining = database.execute_statement(db, cursor, '''
+    SELECT COUNT(*), COUNT(estimated_seconds), SUM(estimated_seconds) FROM frame_task
+        WHERE render_project_id = %s AND status IN (%s, %s);
+    ''', (project_id, created_id, reserved_id), with_result=True)[0]
+
+    average = database.execute_statement(db, cursor, '''
+    SELECT AVG(render_seconds) FROM frame_render_metric WHERE render_project_id = %s AND render_seconds IS NOT NULL;
+    ''', (project_id,), with_result=True)[0][0]
+
+    machines = database.execute_statement(db, cursor, '''
+    SELECT COUNT(DISTINCT machine_id) FROM frame_task
+        WHERE render_project_id = %s AND status = %s AND lease_expires >= UTC_TIMESTAMP(6);
+    ''', (project_id, reserved_id), with_result=True)[0][0]
+
+    frames, estimated_frames, estimated_seconds = remaining
+    if frames == 0:
+        return {'remaining_seconds': 0, 'machines': machines, 'eta_seconds': 0}
+
+    if frames > estimated_frames and average is None:
+        return None
+
+    seconds = float(estimated_seconds or 0) + (frames - estimated_frames) * float(average or 0)
+
+    return {
+        'remaining_seconds': seconds,
+        'machines': machines,
+        'eta_seconds': seconds / machines if machines > 0 else None
+    }
+
+
+def remove_outputs(cfg, frames):
+    # leftovers of earlier attempts would otherwise pass for freshly rendered frames
+    for filename in get_output_filenames(cfg, frames):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def is_valid_output(filename):
+    return os.path.isfile(filename) and os.path.getsize(filename) > 0
+
+
+def get_valid_frames(cfg, frames):
+    return [f for f, filename in zip(frames, get_output_filenames(cfg, frames)) if is_valid_output(filename)]
+
+
+def get_output_filenames(cfg, frames):
+    return [os.path.join(os.getcwd(), cfg['general']['output_path'],
+                         cfg['general']['output_prefix'] + '_frame_{:05}.png'.format(f))
+            for f in frames]
+
+
+def upload_batch(args, cfg, db, cursor, frames):
+    if dropbox_upload.upload_files(cfg['dropbox']['access_token'], get_output_filenames(cfg, frames),
+                                   cfg['dropbox']['folder_name'], args.project_name,
+                                   chunk_size_mb=cfg['dropbox']['chunk_size_mb'],
+                                   parallel_uploads=cfg['dropbox']['parallel_uploads']):
+        finish_frames(args, cfg, db, cursor, frames)
+        record_machine_success(cfg, db, cursor)
     else:
-        set_frame_task_status(args, cfg, db, cursor, 'FAILED', frames)
+        # the frames rendered fine, an outage of Dropbox must neither use up their attempts nor quarantine the machine
+        logging.warning('The frame(s) {} of project "{}" could not be uploaded and are queued again.'.format(
+            frame_range.format_ranges(frames), args.project_name))
+        release_frames(args, cfg, db, cursor, frames)
+
+
+def finish_frames(args, cfg, db, cursor, frames):
+    # with a dispatcher the frames are written back in its next batch, without one or if it is gone directly
+    if dispatcher.is_enabled(cfg):
+        project_id = get_project_id(db, cursor, args.project_name)
+
+        if dispatcher.complete(cfg, project_id, frames):
+            release_leases(project_id, frames)
+            return
+
+    set_frame_task_status(args, cfg, db, cursor, 'FINISHED', frames)
+
+
+def release_frames(args, cfg, db, cursor, frames):
+    # claimed frames that were not rendered go back into the queue, through the dispatcher that handed them out
+    if dispatcher.is_enabled(cfg):
+        project_id = get_project_id(db, cursor, args.project_name)
+
+        if dispatcher.release(cfg, project_id, frames):
+            release_leases(project_id, frames)
+            return
+
+    set_frame_task_status(args, cfg, db, cursor, 'CREATED', frames)
 
 
 def cancel_frames(args, cfg, db, cursor):
     if args.all_frames:
-        set_all_frame_task_status_conditional(args, cfg, db, cursor, 'CANCELLED', 'CREATED')
-        set_all_frame_task_status_conditional(args, cfg, db, cursor, 'CANCELLED', 'RESERVED')
+        cancelled = set_all_frame_task_status_conditional(args, cfg, db, cursor, 'CANCELLED', 'CREATED', 'RESERVED')
 
-        logging.info('Cancelled all remaining frames of project "{}".'.format(args.project_name))
+        logging.info('Cancelled all {} remaining frames of project "{}".'.format(cancelled, args.project_name))
     elif args.by_machine != 'none':
         if args.by_machine in ['', 'this']:
             args.by_machine = cfg['general']['machine_name']
 
         if is_machine_registered(cfg, db, cursor, args.by_machine):
-            set_all_frame_task_status_by_machine(args, cfg, db, cursor, args.by_machine, 'CANCELLED')
+            cancelled = set_all_frame_task_status_by_machine(args, cfg, db, cursor, args.by_machine, 'CANCELLED')
 
-            logging.info('Cancelled all remaining frames of project "{}" by machine "{}".'.format(args.project_name, args.by_machine))
+            logging.info('Cancelled all {} remaining frames of project "{}" by machine "{}".'.format(cancelled, args.project_name, args.by_machine))
         else:
             logging.error('Machine "{}" is not registered on the server and has therefore no tasks!'.format(args.by_machine))
 
 
 def free_failed_frames(args, cfg, db, cursor):
+    reset_failed_attempts(args, cfg, db, cursor)
     set_all_frame_task_status_conditional(args, cfg, db, cursor, 'CREATED', 'FAILED')
+    free_failed_tiles(args, cfg, db, cursor)
     logging.info('All failed frames have been reset for project "{}".'.format(args.project_name))
 
 
+def reset_failed_attempts(args, cfg, db, cursor):
+    # freed frames start over with all attempts and on every machine
+    project_id = get_project_id(db, cursor, args.project_name)
+    failed_id = get_frame_status_id(db, cursor, 'FAILED')
+
+    database.execute_statement(db, cursor, '''
+    DELETE FROM frame_failure WHERE render_project_id = %s AND frame_index IN (
+        SELECT frame_index FROM frame_task WHERE render_project_id = %s AND status = %s);
+    ''', (project_id, project_id, failed_id), commit=True)
+
+    database.execute_statement(db, cursor, '''
+    UPDATE frame_task SET attempts = 0, retry_after = NULL WHERE render_project_id = %s AND status = %s;
+    ''', (project_id, failed_id), commit=True)
+
+
 def free_waiting_frames(args, cfg, db, cursor):
     logging.warning('Warning: this will reset frames that might be currently worked on by other machines!')
     set_all_frame_task_status_conditional(args, cfg, db, cursor, 'CREATED', 'RESERVED')
     logging.info('All reserved frames have been reset for project "{}".'.format(args.project_name))
+
+
+def get_queue_depth(db, cursor):
+    # frames by status of every created or running project
+    sql = '''
+    SELECT rp.project_name, fts.status_name, COUNT(*) FROM frame_task ft
+        JOIN render_project rp
+            ON rp.id = ft.render_project_id
+        JOIN frame_task_status fts
+            ON fts.id = ft.status
+        JOIN render_project_history rph
+            ON rph.render_project_id = rp.id
+        JOIN (
+            SELECT render_project_id, MAX(change_date) AS max_date FROM render_project_history
+                GROUP BY render_project_id
+        ) latest ON latest.render_project_id = rph.render_project_id AND latest.max_date = rph.change_date
+        WHERE rph.status IN (%s, %s)
+        GROUP BY rp.project_name, fts.status_name;
+    '''
+    return database.execute_statement(db, cursor, sql, (
+        get_project_status_id(db, cursor, 'CREATED'), get_project_status_id(db, cursor, 'RUNNING')),
+        with_result=True) or []
+
+
+def collect_queue_depth(cfg):
+    # the collector runs on the threads of the exporter, so every collection uses its own connection
+    def collector():
+        db, cursor = database.connect_to_database(cfg)
+        rows = get_queue_depth(db, cursor)
+        database.close_connection(db, cursor)
+
+        metrics.clear('frames')
+        for name, status, count in rows:
+            metrics.set_gauge('frames', count, project=name, status=status)
+
+    metrics.register_collector(collector)
+
+
+def is_tiled(status):
+    return status['tiles_x'] * status['tiles_y'] > 1
+
+
+def get_tile_output_pattern(cfg, tile):
+    return get_output_pattern(cfg) + tiles.get_tile_suffix(tile)
+
+
+def get_tile_filename(cfg, frame, tile):
+    return os.path.join(os.getcwd(), cfg['general']['output_path'],
+                        cfg['general']['output_prefix'] + '_frame_{:05}'.format(frame) + tiles.get_tile_suffix(tile)
+                        + '.png')
+
+
+def get_tile_folder(args):
+    # the tiles are shared between the machines through Dropbox, next to the stitched frames
+    return args.project_name + '/tiles'
+
+
+def set_tile_status(args, cfg, db, cursor, status, frame, tile):
+    project_id = get_project_id(db, cursor, args.project_name)
+    lease_seconds = cfg['render']['lease_seconds'] if status == 'RESERVED' else None
+
+    sql = '''
+    UPDATE frame_tile SET change_date = %s, machine_id = %s, status = %s,
+            lease_expires = DATE_ADD(UTC_TIMESTAMP(6), INTERVAL %s SECOND)
+        WHERE render_project_id = %s AND frame_index = %s AND tile_index = %s;
+    '''
+    database.execute_statement(db, cursor, sql, (
+        dt.datetime.now(tz=dt.timezone.utc), get_machine_id(db, cursor, cfg['general']['machine_name']),
+        get_frame_status_id(db, cursor, status), lease_seconds, project_id, frame, tile), commit=True)
+
+    if status != 'RESERVED':
+        release_tile_lease(project_id, frame, tile)
+
+    logging.debug('Render status of tile {} of frame {} of project "{}" has been changed to {}.'.format(
+        tile, frame, args.project_name, status))
+
+
+def get_open_tile_condition(db, cursor):
+    # tiles of cancelled, failed or already stitched frames are not rendered anymore
+    sql = '''
+    (t.status = %s OR (t.status = %s AND t.lease_expires < UTC_TIMESTAMP(6)))
+        AND EXISTS (SELECT 1 FROM frame_task ft
+            WHERE ft.render_project_id = t.render_project_id AND ft.frame_index = t.frame_index AND ft.status = %s)
+    '''
+    return sql, (get_frame_status_id(db, cursor, 'CREATED'), get_frame_status_id(db, cursor, 'RESERVED'),
+                 get_frame_status_id(db, cursor, 'CREATED'))
+
+
+def get_stitch_condition(db, cursor):
+    # frames whose tiles are all in, including stitches of a crashed machine whose lease ran out
+    sql = '''
+    (ft.status = %s OR (ft.status = %s AND ft.lease_expires < UTC_TIMESTAMP(6)))
+        AND NOT EXISTS (SELECT 1 FROM frame_tile t
+            WHERE t.render_project_id = ft.render_project_id AND t.frame_index = ft.frame_index AND t.status <> %s)
+    '''
+    return sql, (get_frame_status_id(db, cursor, 'CREATED'), get_frame_status_id(db, cursor, 'RESERVED'),
+                 get_frame_status_id(db, cursor, 'FINISHED'))
+
+
+def has_project_open_tiles(args, cfg, db, cursor, project_id):
+    tile_condition, tile_params = get_open_tile_condition(db, cursor)
+    stitch_condition, stitch_params = get_stitch_condition(db, cursor)
+
+    sql = '''
+    SELECT
+        (SELECT COUNT(*) FROM frame_tile t WHERE t.render_project_id = %s AND {}),
+        (SELECT COUNT(*) FROM frame_task ft WHERE ft.render_project_id = %s AND {});
+    '''.format(tile_condition, stitch_condition)
+    result = database.execute_statement(db, cursor, sql, (project_id,) + tile_params + (project_id,) + stitch_params,
+                                        with_result=True)[0]
+
+    return result[0] > 0 or result[1] > 0
+
+
+def reserve_open_tile(args, cfg, db, cursor, project_id):
+    condition, params = get_open_tile_condition(db, cursor)
+
+    sql = '''
+    SELECT t.frame_index, t.tile_index FROM frame_tile t
+        WHERE t.render_project_id = %s AND {}
+        ORDER BY t.frame_index, t.tile_index
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED;
+    '''.format(condition)
+    result = database.execute_statement(db, cursor, sql, (project_id,) + params, with_result=True)
+
+    if len(result) == 0:
+        return None
+
+    frame, tile = result[0]
+    set_tile_status(args, cfg, db, cursor, 'RESERVED', frame, tile)
+
+    return frame, tile
+
+
+def reserve_stitch(args, cfg, db, cursor, project_id):
+    condition, params = get_stitch_condition(db, cursor)
+    retry_condition, retry_params = get_retry_condition(cfg, db, cursor)
+
+    sql = '''
+    SELECT ft.frame_index FROM frame_task ft
+        WHERE ft.render_project_id = %s AND {} AND {}
+        ORDER BY ft.frame_index
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED;
+    '''.format(condition, retry_condition)
+    result = database.execute_statement(db, cursor, sql, (project_id,) + params + retry_params, with_result=True)
+
+    if len(result) == 0:
+        return None
+
+    set_frame_task_status(args, cfg, db, cursor, 'RESERVED', [result[0][0]])
+
+    return result[0][0]
+
+
+def render_tiled_frames(args, cfg, db, cursor, status, threads=0):
+    # one tile is rendered per call, afterwards a frame whose tiles are all in is stitched
+    if status['status'] != 'RUNNING':
+        set_project_status(args, cfg, db, cursor, 'RUNNING')
+
+    project_id = status['project_id']
+
+    tile = database.run_in_transaction(db, cursor, reserve_open_tile, args, cfg, db, cursor, project_id)
+    if tile is not None:
+        hold_tile_lease(project_id, *tile)
+        render_tile(args, cfg, db, cursor, status, tile[0], tile[1], threads)
+
+    frame = database.run_in_transaction(db, cursor, reserve_stitch, args, cfg, db, cursor, project_id)
+    if frame is not None:
+        hold_leases(project_id, [frame])
+        stitch_frame(args, cfg, db, cursor, status, frame)
+
+    return tile is not None or frame is not None
+
+
+def render_tile(args, cfg, db, cursor, status, frame, tile, threads=0):
+    logging.info('Got task to render tile {} of frame {} of project "{}".'.format(tile, frame, args.project_name))
+
+    command = tiles.get_render_command(cfg['general']['blender_path'], get_blender_input(args, cfg, status['filename']),
+                                       get_tile_output_pattern(cfg, tile), frame, tile,
+                                       status['tiles_x'], status['tiles_y'], threads)
+    filename = get_tile_filename(cfg, frame, tile)
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    try:
+        start_time = time.time()
+        returncode, stats = blender.run_blender(command)
+        metrics.inc('blender_exit_total', code=returncode)
+        store_render_metrics(args, cfg, db, cursor, stats, returncode)
+
+        logging.info('Finished rendering tile {} of frame {} for project "{}" ({:0.3f}s).'.format(
+            tile, frame, args.project_name, time.time() - start_time))
+    except Exception as e:
+        logging.critical('During the rendering by Blender an exception occurred: ' + str(e))
+        returncode = None
+
+    if returncode != 0 or not is_valid_output(filename):
+        logging.error('Tile {} of frame {} was not rendered (exit code {}).'.format(tile, frame, returncode))
+        set_tile_status(args, cfg, db, cursor, 'FAILED', frame, tile)
+        return
+
+    # the tile only counts once the other machines can fetch it for stitching
+    if dropbox_upload.upload_files(cfg['dropbox']['access_token'], [filename], cfg['dropbox']['folder_name'],
+                                   get_tile_folder(args), chunk_size_mb=cfg['dropbox']['chunk_size_mb'],
+                                   parallel_uploads=cfg['dropbox']['parallel_uploads']):
+        set_tile_status(args, cfg, db, cursor, 'FINISHED', frame, tile)
+    else:
+        set_tile_status(args, cfg, db, cursor, 'FAILED', frame, tile)
+
+
+def stitch_frame(args, cfg, db, cursor, status, frame):
+    logging.info('Stitching frame {} of project "{}".'.format(frame, args.project_name))
+
+    # tiles rendered on this machine are still on disk, only the others are downloaded
+    tile_files = [get_tile_filename(cfg, frame, tile) for tile in range(status['tiles_x'] * status['tiles_y'])]
+    missing_files = [f for f in tile_files if not os.path.exists(f)]
+
+    if len(missing_files) > 0 and not dropbox_upload.download_files(
+            cfg['dropbox']['access_token'], missing_files, cfg['dropbox']['folder_name'], get_tile_folder(args)):
+        fail_frames(args, cfg, db, cursor, [frame])
+        return
+
+    remove_outputs(cfg, [frame])
+    if not tiles.stitch(cfg['general']['blender_path'], status['tiles_x'], status['tiles_y'], tile_files,
+                        get_output_filenames(cfg, [frame])[0]) or len(get_valid_frames(cfg, [frame])) == 0:
+        fail_frames(args, cfg, db, cursor, [frame])
+        return
+
+    upload_batch(args, cfg, db, cursor, [frame])
+
+
+def free_failed_tiles(args, cfg, db, cursor):
+    sql = '''
+    UPDATE frame_tile SET change_date = %s, status = %s, lease_expires = NULL
+        WHERE render_project_id = %s AND status = %s;
+    '''
+    database.execute_statement(db, cursor, sql, (
+        dt.datetime.now(tz=dt.timezone.utc), get_frame_status_id(db, cursor, 'CREATED'),
+        get_project_id(db, cursor, args.project_name), get_frame_status_id(db, cursor, 'FAILED')), commit=True)
+
+
+def get_compactable_projects(args, cfg, db, cursor):
+    # projects whose latest status is FINISHED or CANCELLED and that still have history left
+    sql = '''
+    SELECT rp.id, rp.project_name FROM render_project rp
+        JOIN render_project_history rph
+            ON rph.render_project_id = rp.id
+        JOIN (
+            SELECT render_project_id, MAX(change_date) AS max_date FROM render_project_history
+                GROUP BY render_project_id
+        ) latest ON latest.render_project_id = rph.render_project_id AND latest.max_date = rph.change_date
+        WHERE rph.status IN (%s, %s)
+            AND EXISTS (SELECT 1 FROM frame_task_history h WHERE h.render_project_id = rp.id)
+            AND (%s = '' OR rp.project_name = %s)
+        ORDER BY rp.id;
+    '''
+    result = database.execute_statement(db, cursor, sql, (
+        get_project_status_id(db, cursor, 'FINISHED'), get_project_status_id(db, cursor, 'CANCELLED'),
+        args.project_name, args.project_name), with_result=True)
+
+    return result or []
+
+
+def archive_project_history(db, cursor, project_id):
+    # one summary row per frame, the final status is taken from the current status table
+    sql = '''
+    INSERT INTO frame_task_history_archive
+        (render_project_id, frame_index, machine_id, status, first_change_date, last_change_date, number_of_changes)
+    SELECT h.render_project_id, h.frame_index, ft.machine_id, ft.status,
+            MIN(h.change_date), MAX(h.change_date), COUNT(*)
+        FROM frame_task_history h
+            JOIN frame_task ft
+                ON ft.render_project_id = h.render_project_id AND ft.frame_index = h.frame_index
+        WHERE h.render_project_id = %s
+        GROUP BY h.render_project_id, h.frame_index, ft.machine_id, ft.status
+    ON DUPLICATE KEY UPDATE
+        machine_id = VALUES(machine_id),
+        status = VALUES(status),
+        first_change_date = LEAST(first_change_date, VALUES(first_change_date)),
+        last_change_date = GREATEST(last_change_date, VALUES(last_change_date)),
+        number_of_changes = number_of_changes + VALUES(number_of_changes);
+    '''
+    database.execute_statement(db, cursor, sql, (project_id,))
+
+    database.execute_statement(db, cursor, '''
+    DELETE FROM frame_task_history WHERE render_project_id = %s;
+    ''', (project_id,))
+
+
+def compact_history(args, cfg, db, cursor):
+    projects = get_compactable_projects(args, cfg, db, cursor)
+
+    if len(projects) == 0:
+        logging.info('There is no history to compact.')
+        return
+
+    # one transaction per project keeps the locks short, an interrupted run just continues with the rest
+    for project_id, name in projects:
+        database.run_in_transaction(db, cursor, archive_project_history, db, cursor, project_id)
+        logging.info('Archived the frame history of project "{}".'.format(name))
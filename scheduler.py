@@ -0,0 +1,120 @@
+import database
+import project
+import copy
+import random
+import time
+import logging
+
+
+def get_schedulable_projects(cfg, db, cursor):
+    # all created or running projects that still have open frames, including reservations with an expired lease,
+    # only frames this machine may claim right now are counted, frames waiting for a retry or left to other
+    # machines would otherwise keep a project at the front of the queue
+    retry_condition, retry_params = project.get_retry_condition(cfg, db, cursor)
+    sql = '''
+    SELECT rp.id, rp.project_name, rp.filename, rp.priority,
+        SUM((ft.status = %s OR (ft.status = %s AND ft.lease_expires < UTC_TIMESTAMP(6))) AND {}) AS open_frames,
+        SUM(ft.status = %s AND ft.lease_expires >= UTC_TIMESTAMP(6)) AS reserved_frames
+    FROM render_project rp
+        JOIN render_project_history rph
+            ON rph.render_project_id = rp.id
+        JOIN (
+            SELECT render_project_id, MAX(change_date) AS max_date FROM render_project_history
+                GROUP BY render_project_id
+        ) latest ON latest.render_project_id = rph.render_project_id AND latest.max_date = rph.change_date
+        JOIN frame_task ft
+            ON ft.render_project_id = rp.id
+        WHERE rph.status IN (%s, %s)
+        GROUP BY rp.id, rp.project_name, rp.filename, rp.priority
+        HAVING open_frames > 0;
+    '''.format(retry_condition)
+    created_id = project.get_frame_status_id(db, cursor, 'CREATED')
+    reserved_id = project.get_frame_status_id(db, cursor, 'RESERVED')
+
+    result = database.execute_statement(db, cursor, sql, (created_id, reserved_id) + retry_params + (
+        reserved_id, project.get_project_status_id(db, cursor, 'CREATED'),
+        project.get_project_status_id(db, cursor, 'RUNNING')), with_result=True)
+
+    if result is None:
+        return []
+
+    return [{
+        'project_id': row[0],
+        'project_name': row[1],
+        'filename': row[2],
+        'priority': row[3],
+        'open_frames': int(row[4]),
+        'reserved_frames': int(row[5] or 0)
+    } for row in result]
+
+
+def priority_policy(projects):
+    # strictly by priority, projects with the same priority are served in the order they were created
+    return sorted(projects, key=lambda p: (-p['priority'], p['project_id']))
+
+
+def fair_share_policy(projects):
+    # the project with the fewest frames in progress relative to its priority weight is served next
+    return sorted(projects, key=lambda p: (p['reserved_frames'] / max(1, p['priority']), -p['priority'],
+                                           p['project_id']))
+
+
+_POLICIES = {
+    'priority': priority_policy,
+    'fair_share': fair_share_policy
+}
+
+
+def register_policy(name, policy):
+    # a policy receives the schedulable projects and returns them in the order they should be served
+    _POLICIES[name] = policy
+
+
+def get_policy(cfg):
+    name = cfg['worker']['policy']
+
+    if name not in _POLICIES:
+        logging.error('Unknown scheduling policy "{}", falling back to "priority".'.format(name))
+        return priority_policy
+
+    return _POLICIES[name]
+
+
+def get_idle_delay(cfg, attempt):
+    # exponential backoff with jitter, so idle workers do not poll the database in lockstep
+    delay = min(float(cfg['worker']['max_idle_backoff']), float(cfg['worker']['idle_backoff']) * 2 ** attempt)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def render_project(args, cfg, db, cursor, project_name, threads=0):
+    project_args = copy.copy(args)
+    project_args.project_name = project_name
+
+    return project.render_frames(project_args, cfg, db, cursor, threads)
+
+
+def run_daemon(args, cfg, db, cursor, threads=0):
+    policy = get_policy(cfg)
+    idle_attempt = 0
+
+    logging.info('Render worker started, serving all open projects.')
+
+    while True:
+        # every poll ends the read transaction of the last one, with autocommit off MySQL would otherwise
+        # keep showing the snapshot of the first poll and the daemon would never see new work
+        database.commit(db)
+        projects = policy(get_schedulable_projects(cfg, db, cursor))
+
+        # all open work of a project may have been claimed by others in the meantime, e.g. the tiles of a frame,
+        # so the next project in line is tried before backing off
+        if any(render_project(args, cfg, db, cursor, p['project_name'], threads) for p in projects):
+            idle_attempt = 0
+            continue
+
+        delay = get_idle_delay(cfg, idle_attempt)
+        idle_attempt += 1
+
+        if len(projects) == 0:
+            logging.debug('No open frames in any project, waiting {:0.1f}s.'.format(delay))
+
+        time.sleep(delay)
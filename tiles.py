@@ -0,0 +1,49 @@
+import blender
+import logging
+import os
+
+
+_STITCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blender_stitch.py')
+
+# run before the frame is rendered, limits the render to the border of one tile and crops the image to it
+_BORDER_SCRIPT = ('import bpy; r = bpy.context.scene.render; r.use_border = True; r.use_crop_to_border = True; '
+                  'r.border_min_x, r.border_max_x, r.border_min_y, r.border_max_y = {}, {}, {}, {}')
+
+
+def get_tile_border(tile, tiles_x, tiles_y):
+    # tiles are numbered row by row starting at the bottom left, the same order Blender stores pixels in
+    x, y = tile % tiles_x, tile // tiles_x
+    return x / tiles_x, (x + 1) / tiles_x, y / tiles_y, (y + 1) / tiles_y
+
+
+def get_tile_suffix(tile):
+    return '_tile_{:03}'.format(tile)
+
+
+def get_render_command(blender_path, filename, pattern, frame, tile, tiles_x, tiles_y, threads=0):
+    command = [blender_path, '-b', filename,
+               '--python-expr', _BORDER_SCRIPT.format(*get_tile_border(tile, tiles_x, tiles_y)),
+               '-o', pattern]
+
+    if threads > 0:
+        command += ['-t', str(threads)]
+
+    return command + ['-f', str(frame)]
+
+
+def stitch(blender_path, tiles_x, tiles_y, tile_files, output):
+    # NumPy ships with Blender, so the tiles are joined there instead of adding a dependency to the workers
+    command = [blender_path, '-b', '--factory-startup', '--python-exit-code', '1', '--python', _STITCH_SCRIPT,
+               '--', output, str(tiles_x), str(tiles_y)] + tile_files
+
+    try:
+        returncode, _ = blender.run_blender(command)
+    except Exception as e:
+        logging.critical('The tiles could not be stitched: ' + str(e))
+        return False
+
+    if returncode != 0 or not os.path.exists(output):
+        logging.error('Stitching the tiles into "{}" failed (exit code {}).'.format(output, returncode))
+        return False
+
+    return True
@@ -0,0 +1,210 @@
+import database
+import frame_range
+import project
+import scheduler
+import concurrent.futures
+import contextlib
+import threading
+import queue
+import time
+import os
+import logging
+
+
+def get_threads_per_slot(slots):
+    cores = os.cpu_count() or 1
+
+    # the remaining cores go to the first slots, so the whole machine is used without oversubscribing it
+    return [max(1, cores // slots + (1 if i < cores % slots else 0)) for i in range(slots)]
+
+
+def render_loop(args, cfg, db, cursor, threads=0):
+    if args.one_batch:
+        project.render_frames(args, cfg, db, cursor, threads)
+    elif args.some_batches > 0:
+        for _ in range(args.some_batches):
+            project.render_frames(args, cfg, db, cursor, threads)
+    else:
+        idle_attempt = 0
+        while project.has_project_open_frames(args, cfg, db, cursor):
+            if project.render_frames(args, cfg, db, cursor, threads):
+                idle_attempt = 0
+                continue
+
+            # the open frames wait for a retry or are claimed by others, so poll less often
+            time.sleep(scheduler.get_idle_delay(cfg, idle_attempt))
+            idle_attempt += 1
+
+
+def heartbeat_loop(cfg, stop):
+    db, cursor = database.connect_to_database(cfg)
+
+    while not stop.wait(float(cfg['render']['heartbeat_interval'])):
+        try:
+            project.renew_leases(cfg, db, cursor)
+        except Exception as e:
+            logging.error('The leases of the reserved frames could not be renewed: ' + str(e))
+
+    database.close_connection(db, cursor)
+
+
+@contextlib.contextmanager
+def lease_heartbeat(cfg):
+    # keeps the reservations of this process alive, frames of a crashed worker become claimable once the lease ends
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=heartbeat_loop, args=(cfg, stop), name='heartbeat', daemon=True)
+    heartbeat.start()
+
+    try:
+        yield
+    finally:
+        stop.set()
+        heartbeat.join()
+
+
+def get_batch_limit(args):
+    if args.one_batch:
+        return 1
+    elif args.some_batches > 0:
+        return args.some_batches
+    else:
+        return None
+
+
+def upload_loop(args, cfg, uploads):
+    db, cursor = database.connect_to_database(cfg)
+
+    while True:
+        frames = uploads.get()
+        if frames is None:
+            break
+
+        # the frames are only marked as finished once the upload went through
+        try:
+            project.upload_batch(args, cfg, db, cursor, frames)
+        except Exception as e:
+            logging.critical('The upload of frames {} failed: {}'.format(frame_range.format_ranges(frames), e))
+            project.release_frames(args, cfg, db, cursor, frames)
+
+    database.close_connection(db, cursor)
+
+
+def pipeline_loop(args, cfg, db, cursor, threads=0):
+    # a tile is rendered and stitched in one go, there is nothing to overlap
+    if project.is_tiled(project.check_project_status(args, db, cursor)):
+        render_loop(args, cfg, db, cursor, threads)
+        return
+
+    # the bounded queue blocks the renderer when uploads fall behind, instead of filling up the disk
+    uploads = queue.Queue(maxsize=int(cfg['render']['upload_queue_size']))
+    uploader = threading.Thread(target=upload_loop, args=(args, cfg, uploads),
+                                name=threading.current_thread().name + '-upload')
+    uploader.start()
+
+    claim_connection = {}
+    batch_limit = get_batch_limit(args)
+
+    try:
+        status = project.check_project_status(args, db, cursor)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as prefetcher:
+            next_batch = None
+            try:
+                next_batch = prefetcher.submit(prefetch_frames, args, cfg, claim_connection)
+                batches = 0
+
+                while next_batch is not None:
+                    frames = next_batch.result()
+                    if len(frames) == 0:
+                        break
+
+                    batches += 1
+
+                    # the next batch is claimed while this one renders
+                    if batch_limit is None or batches < batch_limit:
+                        next_batch = prefetcher.submit(prefetch_frames, args, cfg, claim_connection)
+                    else:
+                        next_batch = None
+
+                    rendered_frames = project.render_batch(args, cfg, db, cursor, status['filename'], frames,
+                                                           threads)
+                    project.fail_frames(args, cfg, db, cursor, [f for f in frames if f not in rendered_frames])
+
+                    if len(rendered_frames) > 0:
+                        uploads.put(rendered_frames)
+            finally:
+                release_prefetched_frames(args, cfg, db, cursor, next_batch)
+                prefetcher.submit(close_prefetch_connection, claim_connection)
+    finally:
+        uploads.put(None)
+        uploader.join()
+
+
+def prefetch_frames(args, cfg, connection):
+    # the claim connection is opened by the prefetch thread itself, SQLite only lets the thread that
+    # opened a connection use it
+    if 'db' not in connection:
+        connection['db'], connection['cursor'] = database.connect_to_database(cfg)
+
+    return project.request_frames_to_render(args, cfg, connection['db'], connection['cursor'])
+
+
+def release_prefetched_frames(args, cfg, db, cursor, batch):
+    # a batch claimed ahead of a failed render is handed back right away instead of waiting for its lease to end
+    if batch is None or batch.cancel():
+        return
+
+    try:
+        frames = batch.result()
+    except Exception as e:
+        logging.error('The prefetched batch could not be claimed: ' + str(e))
+        return
+
+    if len(frames) > 0:
+        logging.info('Releasing the prefetched frame(s) {}.'.format(frame_range.format_ranges(frames)))
+        project.release_frames(args, cfg, db, cursor, frames)
+
+
+def close_prefetch_connection(connection):
+    if 'db' in connection:
+        database.close_connection(connection.pop('db'), connection.pop('cursor'))
+
+
+def run_worker(args, cfg, db, cursor, threads=0):
+    try:
+        if args.action == 'worker':
+            scheduler.run_daemon(args, cfg, db, cursor, threads)
+        elif args.pipeline:
+            pipeline_loop(args, cfg, db, cursor, threads)
+        else:
+            render_loop(args, cfg, db, cursor, threads)
+    finally:
+        project.stop_persistent_blender()
+
+
+def run_slot(args, cfg, slot, threads):
+    # every slot needs its own connection, connections must not be shared between threads
+    db, cursor = database.connect_to_database(cfg)
+
+    logging.info('Render slot {} started with {} thread(s).'.format(slot, threads))
+
+    try:
+        run_worker(args, cfg, db, cursor, threads)
+    except Exception as e:
+        logging.critical('Render slot {} stopped because of an exception: {}'.format(slot, e))
+    finally:
+        database.close_connection(db, cursor)
+
+    logging.info('Render slot {} finished.'.format(slot))
+
+
+def run_slots(args, cfg):
+    threads_per_slot = get_threads_per_slot(args.slots)
+
+    slots = [threading.Thread(target=run_slot, args=(args, cfg, i, threads), name='slot-{}'.format(i))
+             for i, threads in enumerate(threads_per_slot)]
+
+    for slot in slots:
+        slot.start()
+    for slot in slots:
+        slot.join()